@@ -1,34 +1,212 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 '''
-This script collects the running times of the tests present in the current
-directory.
+This script keeps a history of the running times of the tests present in
+the current directory, and shows how they change from commit to commit.
 
-It does not run the tests but reads the already present output files.
+It does not run the tests but reads the already present output files, in
+which jbmc reports the time of each call to the decision procedure. The
+times of a test are added up and stored for the current commit in an
+SQLite database, which is kept across runs and commits.
 
 Usage:
-    python performance.py
+    python3 performance.py [record]   store the times of the current commit
+    python3 performance.py plot       draw the times of all commits
+    python3 performance.py check      list the tests that got slower
 
 Dependencies:
-    gnuplot http://www.gnuplot.info/
+    gnuplot http://www.gnuplot.info/ (for plot)
 '''
 
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import sys
 import time
 from subprocess import check_output
 from subprocess import check_call
 
-git_output = check_output(['git', 'show', 'HEAD'])
-commit = git_output.split('\n')[0]
-commit_id = time.strftime('%Y_%m_%d__%H_%M_%S')+'__'+commit[7:]
+RUNTIME_RE = re.compile(r'^Runtime decision procedure: ([0-9.e+-]+)s$', re.M)
 
-process = check_output(['grep', '^Runtime decision procedure', '-R'])
-file_name = 'performance_'+commit_id+'.out'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS commits (
+    commit_id TEXT PRIMARY KEY,
+    subject TEXT,
+    commit_time INTEGER,
+    recorded TEXT);
+CREATE TABLE IF NOT EXISTS times (
+    commit_id TEXT REFERENCES commits(commit_id),
+    test TEXT,
+    seconds REAL,
+    calls INTEGER,
+    PRIMARY KEY (commit_id, test));
+'''
+
+
+def open_history(file_name):
+    db = sqlite3.connect(file_name)
+    db.executescript(SCHEMA)
+    return db
+
+
+def read_times():
+    '''
+    Return {test: (seconds, calls)} for the output files of the tests. A
+    test is named by its output file without the extension, so that runs
+    with a suffix (test.pl -s) are kept apart.
+    '''
+    times = {}
+    for out_file in sorted(glob.glob('*/*.out')):
+        with open(out_file, errors='replace') as f:
+            runtimes = [float(t) for t in RUNTIME_RE.findall(f.read())]
+        if runtimes:
+            times[os.path.splitext(out_file)[0]] = (sum(runtimes),
+                                                    len(runtimes))
+    return times
+
+
+def current_commit():
+    ''' Return the hash, subject and time of the commit checked out.  '''
+    git_output = check_output(['git', 'show', '-s', '--format=%H%n%ct%n%s',
+                               'HEAD']).decode('utf-8')
+    commit_id, commit_time, subject = git_output.split('\n', 2)
+    return commit_id, subject.strip(), int(commit_time)
+
+
+def history(db):
+    '''
+    Return the recorded commits, oldest first, as (commit_id, subject), and
+    {test: {commit_id: seconds}}.
+    '''
+    commits = db.execute('SELECT commit_id, subject FROM commits '
+                         'ORDER BY commit_time, recorded').fetchall()
+    tests = {}
+    for commit_id, test, seconds in db.execute(
+            'SELECT commit_id, test, seconds FROM times'):
+        tests.setdefault(test, {})[commit_id] = seconds
+    return commits, tests
+
+
+def record(db, args):
+    times = read_times()
+    if not times:
+        print('no test output with decision procedure times found')
+        return 1
+    commit_id, subject, commit_time = current_commit()
+    with db:
+        db.execute('INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?)',
+                   (commit_id, subject, commit_time,
+                    time.strftime('%Y-%m-%d %H:%M:%S')))
+        db.execute('DELETE FROM times WHERE commit_id = ?', (commit_id,))
+        db.executemany('INSERT INTO times VALUES (?, ?, ?, ?)',
+                       [(commit_id, test, seconds, calls)
+                        for test, (seconds, calls) in sorted(times.items())])
+    print('recorded', len(times), 'tests for', commit_id[:10], subject)
+    return 0
+
+
+def regressions(commits, tests, threshold, min_seconds):
+    '''
+    Return (commit_id, test, before, after) for every time of a test that
+    is more than the fraction threshold above its time at the previous
+    commit it ran at. Times below min_seconds are too noisy to compare.
+    '''
+    found = []
+    for test, times in sorted(tests.items()):
+        before = None
+        for commit_id, _ in commits:
+            if commit_id not in times:
+                continue
+            after = times[commit_id]
+            if (before is not None and after >= min_seconds and
+                    after > before * (1 + threshold)):
+                found.append((commit_id, test, before, after))
+            before = after
+    return found
+
+
+def check(db, args):
+    commits, tests = history(db)
+    if args.last:
+        # only changes into the last commits, but compared with their
+        # predecessors
+        last = set(c for c, _ in commits[-args.last:])
+    else:
+        last = set(c for c, _ in commits)
+    subjects = dict(commits)
+    found = [r for r in regressions(commits, tests, args.threshold,
+                                    args.min_seconds) if r[0] in last]
+    for commit_id, test, before, after in found:
+        print('%s %s: %s %.3fs -> %.3fs (%+.0f%%)' % (
+            commit_id[:10], subjects[commit_id], test, before, after,
+            (after / before - 1) * 100 if before else float('inf')))
+    if not found:
+        print('no test got slower by more than %.0f%%' %
+              (args.threshold * 100))
+    return 1 if found else 0
+
+
+def plot(db, args):
+    commits, tests = history(db)
+    if args.tests:
+        tests = dict((t, v) for t, v in tests.items()
+                     if re.search(args.tests, t))
+    data_file = args.output + '.dat'
+    # one gnuplot data block per test: the title, then the commit number,
+    # the time and the commit
+    with open(data_file, 'w') as f:
+        for test, times in sorted(tests.items()):
+            f.write('"%s" "" ""\n' % test)
+            for i, (commit_id, _) in enumerate(commits):
+                if commit_id in times:
+                    f.write('%d %g %s\n' % (i, times[commit_id],
+                                            commit_id[:7]))
+            f.write('\n\n')
+    print('drawing to file', args.output)
+    check_call(['gnuplot', '-e', 'file="' + data_file + '"', '-e',
+                'outputfile="' + args.output + '"', '-e',
+                'blocks=%d' % len(tests),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'performance_draw.gp')])
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default='performance.db',
+                        help='SQLite file holding the history '
+                             '(default: performance.db)')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('record', help='Store the times of the current commit')
+    plot_parser = commands.add_parser('plot',
+                                      help='Draw the times of all commits')
+    plot_parser.add_argument('--tests', metavar='REGEX',
+                             help='Only draw the tests matching REGEX')
+    plot_parser.add_argument('-o', '--output', default='performance.png',
+                             help='Image to draw to '
+                                  '(default: performance.png)')
+    check_parser = commands.add_parser(
+        'check', help='List tests that got slower than at the previous commit')
+    check_parser.add_argument('--threshold', type=float, default=0.2,
+                              help='Slowdown to report, as a fraction '
+                                   '(default: 0.2)')
+    check_parser.add_argument('--min-seconds', type=float, default=0.05,
+                              help='Ignore times below this (default: 0.05)')
+    check_parser.add_argument('--last', type=int, metavar='N',
+                              help='Only report the last N commits')
+    args = parser.parse_args()
 
-print 'writing to file', file_name
+    db = open_history(args.history)
+    try:
+        command = {'record': record, 'plot': plot, 'check': check}
+        return command[args.command or 'record'](db, args)
+    finally:
+        db.close()
 
-with open(file_name, 'w') as f:
-    f.write(process)
 
-print('drawing to file', file_name+'.png')
-check_call(['gnuplot', '-e', 'file="'+file_name+'"', '-e',
-            'outputfile="'+file_name+'.png"', 'performance_draw.gp'])
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,11 @@
-set datafile separator ":"
-set term png
+set term png size 1280,800
 set output outputfile
 set logscale y 10
 set yrange  [0.01:100]
+set xlabel "commit"
+set ylabel "decision procedure time (s)"
+set xtics rotate by 90 right
+set key outside right font ",8"
 
-plot file using 3 with lines
+plot for [i=0:blocks-1] file index i using 1:2:xtic(3) \
+  with linespoints title columnheader(1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Run the cpp-linter regression tests without starting cpplint for each test.
+
+This checks the same as
+
+    ../test.pl -c "python ../../../scripts/cpplint.py"
+
+but imports cpplint only once. Each test then runs cpplint's main in a
+process forked from this one, so it starts from a pristine copy of
+cpplint's state, and tests run in parallel. Before forking, the sources of
+all tests are linted once with errors discarded, so that the children
+share cpplint's compiled regular expressions instead of each compiling
+them. As with test.pl, each test's output is written to test.out in its
+directory. Run this with the Python that runs cpplint, from this
+directory.
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import pickle
+import re
+import select
+import sys
+import time
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts'))
+import cpplint
+
+
+LEVELS = ['CORE', 'THOROUGH', 'FUTURE', 'KNOWNBUG']
+
+
+def load(desc):
+    """
+    Return the level, source file, options, whether to match across lines,
+    and the required and disallowed patterns of a test.desc file.
+    """
+    with open(desc) as f:
+        lines = [l.rstrip('\r\n') for l in f if not l.startswith('//')]
+    lines += [''] * (3 - len(lines))
+    level_and_tags, source, options = lines[:3]
+    patterns = lines[3:]
+    multi_line = patterns[:1] == ['activate-multi-line-match']
+    if multi_line:
+        patterns = patterns[1:]
+    required = []
+    disallowed = []
+    included = [required, disallowed]
+    for p in patterns:
+        if p == '--':
+            included.pop(0)
+            if not included:
+                break
+        else:
+            included[0].append(p)
+    return (level_and_tags.split()[0], source, options, multi_line, required,
+            disallowed)
+
+
+def run_cpplint(test_dir, source, options):
+    """ Return the output and exit value of cpplint on a test.  """
+    os.chdir(test_dir)
+    output = StringIO()
+    sys.stdout = sys.stderr = output
+    sys.argv = ['cpplint.py'] + options.split() + [source]
+    cpplint._cpplint_state = cpplint._CppLintState()
+    try:
+        cpplint.main()
+        exit_value = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, (bool, int)):
+            exit_value = int(e.code or 0)
+        else:
+            output.write('%s\n' % e.code)
+            exit_value = 1
+    return output.getvalue(), exit_value
+
+
+def matches(pattern, output, multi_line):
+    if multi_line:
+        return re.search(pattern, output, re.M) is not None
+    return any(re.search(pattern, line) for line in output.split('\n'))
+
+
+def run_test(desc):
+    """
+    Run the test described by desc in this process. Return the test, whether
+    it failed, and a log of the pattern checks.
+    """
+    start = time.time()
+    level, source, options, multi_line, required, disallowed = load(desc)
+    test_dir = os.path.dirname(desc)
+    output, exit_value = run_cpplint(test_dir, source, options)
+    output += 'EXIT=%d\nSIGNAL=0\n' % exit_value
+    out_file = re.sub(r'\.[^.]*$', '', os.path.basename(desc)) + '.out'
+    with open(out_file, 'w') as f:
+        f.write(output)
+
+    failed = False
+    log = []
+    for patterns, included in [(required, True), (disallowed, False)]:
+        for p in patterns:
+            ok = matches(p, output, multi_line) == included
+            failed = failed or not ok
+            log.append('%s [%s]' % (p, 'OK' if ok else 'FAILED'))
+    # a known bug is expected to make its test fail
+    return desc, failed != (level == 'KNOWNBUG'), log, time.time() - start
+
+
+def compile_regexps(descs):
+    """
+    Lint the test sources without reporting anything, which fills cpplint's
+    cache of compiled regular expressions.
+    """
+    for desc in descs:
+        source = os.path.join(os.path.dirname(desc), load(desc)[1])
+        with open(source) as f:
+            lines = f.read().split('\n')
+        cpplint.ProcessFileData(source, 'cpp', lines, lambda *args: None)
+
+
+def fork_test(desc):
+    """
+    Run a test in a child process; return its pid and a file to read the
+    result of run_test from.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            result = run_test(desc)
+        except Exception:
+            result = (desc, True, traceback.format_exc().splitlines(), 0.0)
+        with os.fdopen(w, 'wb') as f:
+            pickle.dump(result, f)
+        os._exit(0)
+    os.close(w)
+    return pid, os.fdopen(r, 'rb')
+
+
+def run_tests(descs, jobs):
+    """ Run the tests, up to jobs of them at a time.  """
+    pending = list(descs)
+    running = {}
+    results = []
+    while pending or running:
+        while pending and len(running) < jobs:
+            pid, f = fork_test(pending.pop(0))
+            running[f] = pid
+        ready, _, _ = select.select(list(running), [], [])
+        for f in ready:
+            results.append(pickle.load(f))
+            f.close()
+            os.waitpid(running.pop(f), 0)
+    return sorted(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tests', nargs='*',
+            help='Test directories (default: all)')
+    parser.add_argument('-j', '--jobs', type=int,
+            default=multiprocessing.cpu_count(),
+            help='Number of tests to run in parallel (default: one per CPU)')
+    parser.add_argument('-p', '--print-logs', action='store_true',
+            help='Print the pattern checks of failed tests')
+    for level in LEVELS:
+        parser.add_argument('-' + level[0], dest='levels',
+                action='append_const', const=level,
+                help='Run %s tests' % level)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    dirs = args.tests or sorted(
+        d for d in os.listdir(here) if os.path.isdir(os.path.join(here, d)))
+    descs = [os.path.abspath(desc) for d in dirs
+             for desc in sorted(glob.glob(os.path.join(here, d, '*.desc')))]
+    levels = args.levels or ['CORE']
+    selected = [desc for desc in descs if load(desc)[0] in levels]
+    skipped = len(descs) - len(selected)
+
+    start = time.time()
+    compile_regexps(selected)
+    results = run_tests(selected, max(1, args.jobs))
+
+    failures = 0
+    for desc, failed, log, seconds in results:
+        name = os.path.relpath(desc, here)
+        if failed:
+            failures += 1
+            print('  %s  [FAILED]' % name)
+            if args.print_logs:
+                for line in log:
+                    print('    ' + line)
+        else:
+            print('  %s  [OK] in %.3f seconds' % (name, seconds))
+
+    print('\n%d tests, %d failed, %d skipped in %.2f seconds' % (
+        len(selected), failures, skipped, time.time() - start))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -45,12 +45,17 @@ same line, but it is far from perfect (in either direction).
 import codecs
 import copy
 import getopt
+import json
 import math  # for log
 import os
 import re
 import sre_compile
+import sre_constants
+import sre_parse
 import string
 import sys
+import timeit
+import types
 import unicodedata
 
 
@@ -58,6 +63,7 @@ _USAGE = """
 Syntax: cpplint.py [--verbose=#] [--output=vs7] [--filter=-x,+y,...]
                    [--counting=total|toplevel|detailed] [--root=subdir]
                    [--linelength=digits] [--headers=x,y,...]
+                   [--profile] [--profile-json=file]
         <file> [file] ...
 
   The style guidelines this tries to follow are those in
@@ -149,6 +155,15 @@ Syntax: cpplint.py [--verbose=#] [--output=vs7] [--filter=-x,+y,...]
         --headers=hpp,hxx
         --headers=hpp
 
+    profile
+      Record the time spent in each check function and on each file, the
+      number of calls and the number of errors reported, and print them
+      sorted by time once all files are done.  Times and errors of a check
+      include those of the checks it calls.
+
+    profile-json=file
+      Like profile, but also write the numbers to file as JSON.
+
     cpplint.py supports per-directory configurations specified in CPPLINT.cfg
     files. CPPLINT.cfg file can contain a number of key=value pairs.
     Currently the following options are supported:
@@ -588,6 +603,14 @@ _hpp_headers = set(['h'])
 # category should be suppressed for every line.
 _global_error_suppressions = {}
 
+# {int, match}: a map from line numbers to the NOLINT comments on these lines,
+# as found by IndexNolintComments for the file being processed, or None if the
+# file has not been indexed.
+_nolint_comments = None
+
+# Matches a NOLINT comment.
+_RE_PATTERN_NOLINT = re.compile(r'\bNOLINT(NEXTLINE)?\b(\([^)]+\))?')
+
 def ProcessHppHeadersOption(val):
   global _hpp_headers
   try:
@@ -605,7 +628,8 @@ def ParseNolintSuppressions(filename, raw_line, linenum, error):
 
   Parses any NOLINT comments on the current line, updating the global
   error_suppressions store.  Reports an error if the NOLINT comment
-  was malformed.
+  was malformed.  If the file has been indexed by IndexNolintComments,
+  the comment is looked up rather than searched for.
 
   Args:
     filename: str, the name of the input file.
@@ -613,7 +637,10 @@ def ParseNolintSuppressions(filename, raw_line, linenum, error):
     linenum: int, the number of the current line.
     error: function, an error handler.
   """
-  matched = Search(r'\bNOLINT(NEXTLINE)?\b(\([^)]+\))?', raw_line)
+  if _nolint_comments is None:
+    matched = _RE_PATTERN_NOLINT.search(raw_line)
+  else:
+    matched = _nolint_comments.get(linenum)
   if matched:
     if matched.group(1):
       suppressed_line = linenum + 1
@@ -632,6 +659,40 @@ def ParseNolintSuppressions(filename, raw_line, linenum, error):
                 'Unknown NOLINT error category: %s' % category)
 
 
+def IndexNolintComments(lines):
+  """Finds the NOLINT comments of a file.
+
+  Rather than searching each line, finds the comments in a single pass over
+  the whole file, so that lines without NOLINT comments cost nothing.  Until
+  the next ResetNolintSuppressions, ParseNolintSuppressions then looks up
+  the comments of lines of this file.
+
+  Args:
+    lines: An array of strings, each representing a line of the file.
+
+  Returns:
+    A dictionary mapping the numbers of the lines with NOLINT comments to
+    the matches of these comments.
+  """
+  global _nolint_comments
+  _nolint_comments = {}
+  text = '\n'.join(lines)
+  linenum = 0
+  line_start = 0
+  pos = text.find('NOLINT')
+  while pos >= 0:
+    linenum += text.count('\n', line_start, pos)
+    line_start = text.rfind('\n', 0, pos) + 1
+    matched = _RE_PATTERN_NOLINT.search(lines[linenum])
+    if matched:
+      _nolint_comments[linenum] = matched
+    line_end = text.find('\n', pos)
+    if line_end < 0:
+      break
+    pos = text.find('NOLINT', line_end)
+  return _nolint_comments
+
+
 def ProcessGlobalSuppresions(lines):
   """Updates the list of global error suppressions.
 
@@ -641,19 +702,27 @@ def ProcessGlobalSuppresions(lines):
     lines: An array of strings, each representing a line of the file, with the
            last element being empty if the file is terminated with a newline.
   """
-  for line in lines:
-    if _SEARCH_C_FILE.search(line):
-      for category in _DEFAULT_C_SUPPRESSED_CATEGORIES:
-        _global_error_suppressions[category] = True
-    if _SEARCH_KERNEL_FILE.search(line):
-      for category in _DEFAULT_KERNEL_SUPPRESSED_CATEGORIES:
-        _global_error_suppressions[category] = True
+  # Only search the lines if the whole file contains the text that the
+  # directives require.
+  text = '\n'.join(lines)
+  if 'LINT_C_FILE' in text or 'filetype=c' in text:
+    for line in lines:
+      if _SEARCH_C_FILE.search(line):
+        for category in _DEFAULT_C_SUPPRESSED_CATEGORIES:
+          _global_error_suppressions[category] = True
+  if 'LINT_KERNEL_FILE' in text:
+    for line in lines:
+      if _SEARCH_KERNEL_FILE.search(line):
+        for category in _DEFAULT_KERNEL_SUPPRESSED_CATEGORIES:
+          _global_error_suppressions[category] = True
 
 
 def ResetNolintSuppressions():
   """Resets the set of NOLINT suppressions to empty."""
+  global _nolint_comments
   _error_suppressions.clear()
   _global_error_suppressions.clear()
+  _nolint_comments = None
 
 
 def IsErrorSuppressedByNolint(category, linenum):
@@ -897,6 +966,15 @@ class _CppLintState(object):
     # "vs7" - format that Microsoft Visual Studio 7 can parse
     self.output_format = 'emacs'
 
+    # errors not written yet, as (stream name, text) pairs, and the names
+    # of files as printed with them; see FlushOutput
+    self.pending_output = []
+    self.printed_names = {}
+
+    # a _Profiler if --profile or --profile-json is given
+    self.profiler = None
+    self.profile_json = None  # file to write the profile to
+
   def SetOutputFormat(self, output_format):
     """Sets the output format for errors."""
     self.output_format = output_format
@@ -963,6 +1041,35 @@ class _CppLintState(object):
         self.errors_by_category[category] = 0
       self.errors_by_category[category] += 1
 
+  def BufferOutput(self, stream, text):
+    """Adds text to be written to sys.stdout or sys.stderr by FlushOutput."""
+    self.pending_output.append((stream, text))
+
+  def PrintedName(self, filename):
+    """Returns the name of a file as printed in the default output format."""
+    if filename not in self.printed_names:
+      self.printed_names[filename] = FileInfo(filename).RepositoryName()
+    return self.printed_names[filename]
+
+  def FlushOutput(self):
+    """Writes the buffered output, with one write per run of each stream.
+
+    Called once per file, so that output goes through the streams' (possibly
+    encoding) wrappers in a few large writes rather than one per error.
+    """
+    start = 0
+    pending = self.pending_output
+    while start < len(pending):
+      stream = pending[start][0]
+      end = start + 1
+      while end < len(pending) and pending[end][0] == stream:
+        end += 1
+      getattr(sys, stream).write(''.join(
+          text for _, text in pending[start:end]))
+      start = end
+    self.pending_output = []
+    self.printed_names = {}
+
   def PrintErrorCounts(self):
     """Print a summary of errors by category, and the total."""
     for category, count in self.errors_by_category.iteritems():
@@ -1203,6 +1310,14 @@ def _ShouldPrintError(category, confidence, linenum):
   if confidence < _cpplint_state.verbose_level:
     return False
 
+  if _IsFiltered(category):
+    return False
+
+  return True
+
+
+def _IsFiltered(category):
+  """Returns true if the filters filter out errors of the category."""
   is_filtered = False
   for one_filter in _Filters():
     if one_filter.startswith('-'):
@@ -1213,10 +1328,7 @@ def _ShouldPrintError(category, confidence, linenum):
         is_filtered = False
     else:
       assert False  # should have been checked for in SetFilter.
-  if is_filtered:
-    return False
-
-  return True
+  return is_filtered
 
 
 def Error(filename, linenum, category, confidence, message):
@@ -1244,23 +1356,22 @@ def Error(filename, linenum, category, confidence, message):
   if _ShouldPrintError(category, confidence, linenum):
     _cpplint_state.IncrementErrorCount(category)
     if _cpplint_state.output_format == 'vs7':
-      sys.stderr.write('%s(%s):  %s  [%s] [%d]\n' % (
+      _cpplint_state.BufferOutput('stderr', '%s(%s):  %s  [%s] [%d]\n' % (
           filename, linenum, message, category, confidence))
     elif _cpplint_state.output_format == 'eclipse':
-      sys.stderr.write('%s:%s: warning: %s  [%s] [%d]\n' % (
+      _cpplint_state.BufferOutput('stderr', '%s:%s: warning: %s  [%s] [%d]\n' % (
           filename, linenum, message, category, confidence))
     elif _cpplint_state.output_format in ['sed', 'gsed']:
       if message in _SED_FIXUPS:
-        sys.stdout.write(_cpplint_state.output_format + " -i '%s%s' %s # %s  [%s] [%d]\n" % (
+        _cpplint_state.BufferOutput('stdout', _cpplint_state.output_format + " -i '%s%s' %s # %s  [%s] [%d]\n" % (
             linenum, _SED_FIXUPS[message], filename, message, category, confidence))
       else:
-        sys.stderr.write('# %s:%s:  "%s"  [%s] [%d]\n' % (
+        _cpplint_state.BufferOutput('stderr', '# %s:%s:  "%s"  [%s] [%d]\n' % (
             filename, linenum, message, category, confidence))
     else:
-      fileinfo = FileInfo(filename)
-      path_from_root = fileinfo.RepositoryName()
-      sys.stderr.write('%s:%s:  %s  [%s] [%d]\n' % (
-          path_from_root, linenum, message, category, confidence))
+      _cpplint_state.BufferOutput('stderr', '%s:%s:  %s  [%s] [%d]\n' % (
+          _cpplint_state.PrintedName(filename), linenum, message, category,
+          confidence))
 
 
 # Matches standard C++ escape sequences per 2.13.2.3 of the C++ standard.
@@ -1281,6 +1392,9 @@ _RE_PATTERN_CLEANSE_LINE_C_COMMENTS = re.compile(
     _RE_PATTERN_C_COMMENTS + r'\s+|' +
     r'\s+' + _RE_PATTERN_C_COMMENTS + r'(?=\W)|' +
     _RE_PATTERN_C_COMMENTS + r')')
+# Matches parentheses, brackets and braces, see _BracketIndex.
+_RE_PATTERN_BRACKET = re.compile(r'[()\[\]{}]')
+_MATCHING_BRACKET = {'(': ')', '[': ']', '{': '}'}
 
 
 def IsCppString(line):
@@ -1460,11 +1574,18 @@ class CleansedLines(object):
           self.lines_without_raw_strings[linenum]))
       elided = self._CollapseStrings(self.lines_without_raw_strings[linenum])
       self.elided.append(CleanseComments(elided))
+    self._brackets = None
 
   def NumLines(self):
     """Returns the number of lines represented."""
     return self.num_lines
 
+  def Brackets(self):
+    """Returns the _BracketIndex of the elided lines, building it on first use."""
+    if self._brackets is None:
+      self._brackets = _BracketIndex(self.elided)
+    return self._brackets
+
   @staticmethod
   def _CollapseStrings(elided):
     """Collapses strings and chars on a line to simple "" or '' blocks.
@@ -1532,6 +1653,48 @@ class CleansedLines(object):
 
     return collapsed
 
+
+class _BracketIndex(object):
+  """Matching (), [] and {} pairs of a file, found in a single pass.
+
+  Angle brackets are left out, since whether they are brackets at all
+  depends on where matching starts.  The pending '<' and '>' that
+  FindEndOfExpressionInLine and FindStartOfExpressionInLine keep on their
+  stacks never change which parenthesis, bracket or brace closes another
+  one, though, so the pairs here are exactly what those scans find when
+  started at one of them.  Angle brackets are still matched by scanning.
+  """
+
+  def __init__(self, elided):
+    # (linenum, pos) of an opening bracket -> (linenum, pos) just past its
+    # closing bracket, or (linenum, -1) of the line where matching failed
+    self.closing = {}
+    # (linenum, pos) of a closing bracket -> (linenum, pos) of its opening
+    # bracket; closing brackets without one are not in here
+    self.opening = {}
+    stack = []
+    for linenum, line in enumerate(elided):
+      for match in _RE_PATTERN_BRACKET.finditer(line):
+        char = match.group(0)
+        pos = match.start()
+        if char in '([{':
+          stack.append((char, linenum, pos))
+        elif stack:
+          (open_char, open_linenum, open_pos) = stack[-1]
+          if _MATCHING_BRACKET[open_char] == char:
+            stack.pop()
+            self.closing[(open_linenum, open_pos)] = (linenum, pos + 1)
+            self.opening[(linenum, pos)] = (open_linenum, open_pos)
+          else:
+            # Mismatched parentheses, which ends the scan from any of the
+            # brackets still open
+            for (_, open_linenum, open_pos) in stack:
+              self.closing[(open_linenum, open_pos)] = (linenum, -1)
+            stack = []
+    for (_, open_linenum, open_pos) in stack:
+      self.closing[(open_linenum, open_pos)] = (len(elided) - 1, -1)
+
+
 def IsTemplateArgumentList_DB(clean_lines, linenum, pos):
     """if lines[linenum][pos] is >, finds out if it is closing bracket
     of a template argument.
@@ -1652,8 +1815,11 @@ def OpenExpression(clean_lines, linenum, pos):
   line = clean_lines.elided[linenum]
   if (line[pos] not in ')}]>'):
     return (line, clean_lines.NumLines(), -1)
-  else:
-    return ForceOpenExpression(clean_lines, linenum, pos-1, line[pos])
+
+  opening = clean_lines.Brackets().opening.get((linenum, pos))
+  if opening:
+    return (clean_lines.elided[opening[0]], opening[0], opening[1])
+  return ForceOpenExpression(clean_lines, linenum, pos-1, line[pos])
 
 
 def FindEndOfExpressionInLine(line, startpos, stack):
@@ -1740,10 +1906,9 @@ def CloseExpression(clean_lines, linenum, pos):
   If lines[linenum][pos] points to a '(' or '{' or '[' or '<', finds the
   linenum/pos that correspond to the closing of the expression.
 
-  TODO(unknown): cpplint spends a fair bit of time matching parentheses.
-  Ideally we would want to index all opening and closing parentheses once
-  and have CloseExpression be just a simple lookup, but due to preprocessor
-  tricks, this is not so easy.
+  Parentheses, brackets and braces are looked up in the file's
+  _BracketIndex; only '<' needs scanning, since whether it starts a
+  template argument list depends on the code that follows.
 
   Args:
     clean_lines: A CleansedLines instance containing the file.
@@ -1761,6 +1926,12 @@ def CloseExpression(clean_lines, linenum, pos):
   if (line[pos] not in '({[<') or Match(r'<[<=]', line[pos:]):
     return (line, clean_lines.NumLines(), -1)
 
+  if line[pos] != '<':
+    (end_linenum, end_pos) = clean_lines.Brackets().closing[(linenum, pos)]
+    if end_pos > -1:
+      return (clean_lines.elided[end_linenum], end_linenum, end_pos)
+    return (clean_lines.elided[end_linenum], clean_lines.NumLines(), -1)
+
   # Check first line
   (end_pos, stack) = FindEndOfExpressionInLine(line, pos, [])
   if end_pos > -1:
@@ -1904,6 +2075,10 @@ def ReverseCloseExpression(clean_lines, linenum, pos):
   if line[pos] not in ')}]>':
     return (line, 0, -1)
 
+  opening = clean_lines.Brackets().opening.get((linenum, pos))
+  if opening:
+    return (clean_lines.elided[opening[0]], opening[0], opening[1])
+
   # Check last line
   (start_pos, stack) = FindStartOfExpressionInLine(line, pos, [])
   if start_pos > -1:
@@ -2193,6 +2368,195 @@ def CheckForMultilineCommentsAndStrings(filename, clean_lines, linenum, error):
           'Use C++11 raw strings or concatenation instead.')
 
 
+# Checks registered with RegisterLinePatternCheck and
+# RegisterLinePatternHandler, in order of registration, as
+# (compiled pattern, category, confidence, message, handler, stage) tuples.
+_line_pattern_checks = []
+
+# Index of _line_pattern_checks built by _LinePatternIndex, or None if it
+# needs to be rebuilt.
+_line_pattern_index = None
+
+# The last line searched for required literals, and the indices of the
+# checks of each stage that may match it, as found by _LinePatternCandidates.
+_line_pattern_candidates = (None, None)
+
+
+def RegisterLinePatternCheck(pattern, category, confidence, message,
+                             stage='line'):
+  """Registers a check that reports every line on which pattern is found.
+
+  CheckLinePatterns runs all registered checks on each elided line.  Rather
+  than searching each pattern in each line, it first searches for the
+  literal text that the patterns require, in a single pass over the line,
+  and only tries the patterns whose text was found.  Adding such a check
+  thus adds next to nothing to the time spent per line.
+
+  Checks are run in stages, so that their errors are reported in the same
+  order as those of the other checks: 'style' checks run from CheckStyle,
+  after the spacing checks; 'line' checks from ProcessLine, after
+  CheckForNonStandardConstructs; and 'late' checks at the end of
+  ProcessLine, before extra_check_functions.  Within a stage, checks run
+  in order of registration.
+
+  Args:
+    pattern: The regular expression to search for.
+    category: The category of the error reported.
+    confidence: The confidence of the error reported.
+    message: The message of the error reported.
+    stage: The stage to run the check in.
+  """
+  global _line_pattern_index
+  _line_pattern_checks.append(
+      (sre_compile.compile(pattern), category, confidence, message, None,
+       stage))
+  _line_pattern_index = None
+
+
+def RegisterLinePatternHandler(pattern, handler, stage='line'):
+  """Registers a check that needs more than a pattern to find errors.
+
+  Like RegisterLinePatternCheck, but instead of reporting an error, calls
+  handler(filename, clean_lines, linenum, error) on lines on which pattern
+  is found, so pattern needs to be a necessary condition for any error of
+  handler.
+
+  Args:
+    pattern: The regular expression to search for.
+    handler: The check function to call.
+    stage: The stage to run the check in; see RegisterLinePatternCheck.
+  """
+  global _line_pattern_index
+  _line_pattern_checks.append(
+      (sre_compile.compile(pattern), None, None, None, handler, stage))
+  _line_pattern_index = None
+
+
+def _RequiredLiterals(items):
+  """Returns strings of which any match of a parsed pattern contains one.
+
+  Only runs of literal characters at the top level are considered, or one
+  such run in each alternative of a group at the top level.  Of these, the
+  choice whose shortest string is longest is returned.
+
+  Args:
+    items: The pattern, as parsed by sre_parse.
+
+  Returns:
+    A list of strings, or [] if the pattern requires no literal text.
+  """
+  choices = []
+  run = ''
+  for op, av in list(items) + [(None, None)]:
+    if op == sre_constants.LITERAL:
+      run += chr(av)
+      continue
+    if run:
+      choices.append([run])
+      run = ''
+    if op == sre_constants.SUBPATTERN:
+      literals = _RequiredLiterals(av[-1])
+      if literals:
+        choices.append(literals)
+    elif op == sre_constants.BRANCH:
+      alternatives = [_RequiredLiterals(branch) for branch in av[1]]
+      if all(alternatives):
+        choices.append(sum(alternatives, []))
+  if not choices:
+    return []
+  return max(choices, key=lambda literals: min(len(l) for l in literals))
+
+
+def _LinePatternIndex():
+  """Returns the prefilter of the registered line pattern checks.
+
+  Returns:
+    A tuple (keywords, checks_of, always) of a pattern that finds the
+    required literals of all checks, a dictionary mapping each literal to
+    the indices of the checks that it contains a required literal of, and
+    the indices of the checks that require no literal.
+  """
+  global _line_pattern_index
+  if _line_pattern_index is None:
+    literals = {}
+    always = []
+    for index, check in enumerate(_line_pattern_checks):
+      required = _RequiredLiterals(sre_parse.parse(check[0].pattern))
+      if not required:
+        always.append(index)
+      for literal in required:
+        literals.setdefault(literal, set()).add(index)
+    # A lookahead finds literals that overlap, and the longest one at each
+    # position.  Finding a literal means finding all literals it contains.
+    ordered = sorted(literals, key=lambda literal: -len(literal))
+    keywords = None
+    if ordered:
+      keywords = sre_compile.compile(
+          '(?=(' + '|'.join(re.escape(l) for l in ordered) + '))')
+    checks_of = {}
+    for literal in ordered:
+      checks_of[literal] = set()
+      for contained, indices in literals.iteritems():
+        if contained in literal:
+          checks_of[literal].update(indices)
+    _line_pattern_index = (keywords, checks_of, always)
+  return _line_pattern_index
+
+
+def _LinePatternCandidates(line):
+  """Returns the checks of each stage whose required literals are in line.
+
+  The literals are searched once per line, however many stages are run.
+
+  Args:
+    line: The elided line.
+
+  Returns:
+    A dictionary mapping stages to sorted lists of indices of checks.
+  """
+  global _line_pattern_candidates
+  if _line_pattern_candidates[0] != line or _line_pattern_index is None:
+    (keywords, checks_of, always) = _LinePatternIndex()
+    candidates = set(always)
+    if keywords:
+      for match in keywords.finditer(line):
+        candidates.update(checks_of[match.group(1)])
+    of_stage = {}
+    for index in sorted(candidates):
+      of_stage.setdefault(_line_pattern_checks[index][5], []).append(index)
+    _line_pattern_candidates = (line, of_stage)
+  return _line_pattern_candidates[1]
+
+
+def CheckLinePatterns(filename, clean_lines, linenum, error, stage='line'):
+  """Runs the checks registered with RegisterLinePatternCheck on a line.
+
+  Args:
+    filename: The name of the current file.
+    clean_lines: A CleansedLines instance containing the file.
+    linenum: The number of the line to check.
+    error: The function to call with any errors found.
+    stage: The stage of the checks to run; see RegisterLinePatternCheck.
+  """
+  line = clean_lines.elided[linenum]
+  for index in _LinePatternCandidates(line).get(stage, ()):
+    (pattern, category, confidence, message, handler,
+     _) = _line_pattern_checks[index]
+    if pattern.search(line):
+      if handler:
+        handler(filename, clean_lines, linenum, error)
+      else:
+        error(filename, linenum, category, confidence, message)
+
+
+# VLOG() is only to be used for defining a logging level.  For example,
+# VLOG(2) is correct. VLOG(INFO), VLOG(WARNING), VLOG(ERROR), and
+# VLOG(FATAL) are not.
+RegisterLinePatternCheck(
+    r'\bVLOG\((INFO|ERROR|WARNING|DFATAL|FATAL)\)', 'runtime/vlog', 5,
+    'VLOG() should be used with numeric verbosity level.  '
+    'Use LOG() if you want symbolic severity levels.')
+
 # (non-threadsafe name, thread-safe alternative, validation pattern)
 #
 # The validation pattern is used to eliminate false positives such as:
@@ -2222,77 +2586,30 @@ _THREADING_LIST = (
     ('ttyname(', 'ttyname_r(', _UNSAFE_FUNC_PREFIX + r'ttyname\([^)]+\)'),
     )
 
-
-def CheckPosixThreading(filename, clean_lines, linenum, error):
-  """Checks for calls to thread-unsafe functions.
-
-  Much code has been originally written without consideration of
-  multi-threading. Also, engineers are relying on their old experience;
-  they have learned posix before threading extensions were added. These
-  tests guide the engineers to use thread-safe functions (when using
-  posix directly).
-
-  Args:
-    filename: The name of the current file.
-    clean_lines: A CleansedLines instance containing the file.
-    linenum: The number of the line to check.
-    error: The function to call with any errors found.
-  """
-  line = clean_lines.elided[linenum]
-  for single_thread_func, multithread_safe_func, pattern in _THREADING_LIST:
-    # Additional pattern matching check to confirm that this is the
-    # function we are looking for
-    if Search(pattern, line):
-      error(filename, linenum, 'runtime/threadsafe_fn', 2,
-            'Consider using ' + multithread_safe_func +
-            '...) instead of ' + single_thread_func +
-            '...) for improved thread safety.')
-
-
-def CheckVlogArguments(filename, clean_lines, linenum, error):
-  """Checks that VLOG() is only used for defining a logging level.
-
-  For example, VLOG(2) is correct. VLOG(INFO), VLOG(WARNING), VLOG(ERROR), and
-  VLOG(FATAL) are not.
-
-  Args:
-    filename: The name of the current file.
-    clean_lines: A CleansedLines instance containing the file.
-    linenum: The number of the line to check.
-    error: The function to call with any errors found.
-  """
-  line = clean_lines.elided[linenum]
-  if Search(r'\bVLOG\((INFO|ERROR|WARNING|DFATAL|FATAL)\)', line):
-    error(filename, linenum, 'runtime/vlog', 5,
-          'VLOG() should be used with numeric verbosity level.  '
-          'Use LOG() if you want symbolic severity levels.')
+# Calls to thread-unsafe functions.
+#
+# Much code has been originally written without consideration of
+# multi-threading. Also, engineers are relying on their old experience;
+# they have learned posix before threading extensions were added. These
+# tests guide the engineers to use thread-safe functions (when using
+# posix directly).
+for _single_thread_func, _multithread_safe_func, _pattern in _THREADING_LIST:
+  RegisterLinePatternCheck(
+      _pattern, 'runtime/threadsafe_fn', 2,
+      'Consider using ' + _multithread_safe_func +
+      '...) instead of ' + _single_thread_func +
+      '...) for improved thread safety.')
 
 # Matches invalid increment: *count++, which moves pointer instead of
-# incrementing a value.
-_RE_PATTERN_INVALID_INCREMENT = re.compile(
-    r'^\s*\*\w+(\+\+|--);')
-
-
-def CheckInvalidIncrement(filename, clean_lines, linenum, error):
-  """Checks for invalid increment *count++.
-
-  For example following function:
-  void increment_counter(int* count) {
-    *count++;
-  }
-  is invalid, because it effectively does count++, moving pointer, and should
-  be replaced with ++*count, (*count)++ or *count += 1.
-
-  Args:
-    filename: The name of the current file.
-    clean_lines: A CleansedLines instance containing the file.
-    linenum: The number of the line to check.
-    error: The function to call with any errors found.
-  """
-  line = clean_lines.elided[linenum]
-  if _RE_PATTERN_INVALID_INCREMENT.match(line):
-    error(filename, linenum, 'runtime/invalid_increment', 5,
-          'Changing pointer instead of value (or unused value of operator*).')
+# incrementing a value.  For example following function:
+#   void increment_counter(int* count) {
+#     *count++;
+#   }
+# is invalid, because it effectively does count++, moving pointer, and
+# should be replaced with ++*count, (*count)++ or *count += 1.
+RegisterLinePatternCheck(
+    r'^\s*\*\w+(\+\+|--);', 'runtime/invalid_increment', 5,
+    'Changing pointer instead of value (or unused value of operator*).')
 
 
 def IsMacroDefinition(clean_lines, linenum):
@@ -4631,6 +4948,9 @@ def CheckAltTokens(filename, clean_lines, linenum, error):
           'Use operator %s instead of %s' % (
               _ALT_TOKEN_REPLACEMENT[match.group(1)], match.group(1)))
 
+RegisterLinePatternHandler(_ALT_TOKEN_REPLACEMENT_PATTERN.pattern,
+                           CheckAltTokens, stage='style')
+
 
 def CheckAssert(filename, clean_lines, linenum, error):
   """Check for uses of assert.
@@ -4878,7 +5198,7 @@ def CheckStyle(filename, clean_lines, linenum, file_extension, nesting_state,
   # Disabled because whatever CHECK macro this was looking for, it isn't the
   # CHECK macro used in Catch, but was complaining about it anyway.
   #CheckCheck(filename, clean_lines, linenum, error)
-  CheckAltTokens(filename, clean_lines, linenum, error)
+  CheckLinePatterns(filename, clean_lines, linenum, error, stage='style')
   CheckAssert(filename, clean_lines, linenum, error)
   classinfo = nesting_state.InnermostClass()
   if classinfo:
@@ -5876,13 +6196,21 @@ _HEADERS_MAYBE_TEMPLATES = (
 
 _RE_PATTERN_STRING = re.compile(r'\bstring\b')
 
+def _MaybeTemplatePattern(template):
+  # Match max<type>(..., ...), max(..., ...), but not foo->max, foo.max or
+  # type::max().
+  return r'[^>.]\b' + template + r'(<.*?>)?\([^\)]'
+
+
+def _TemplatePattern(template):
+  return r'(\<|\b)' + template + r'\s*\<'
+
+
 _re_pattern_headers_maybe_templates = []
 for _header, _templates in _HEADERS_MAYBE_TEMPLATES:
   for _template in _templates:
-    # Match max<type>(..., ...), max(..., ...), but not foo->max, foo.max or
-    # type::max().
     _re_pattern_headers_maybe_templates.append(
-        (re.compile(r'[^>.]\b' + _template + r'(<.*?>)?\([^\)]'),
+        (re.compile(_MaybeTemplatePattern(_template)),
             _template,
             _header))
 
@@ -5891,10 +6219,80 @@ _re_pattern_templates = []
 for _header, _templates in _HEADERS_CONTAINING_TEMPLATES:
   for _template in _templates:
     _re_pattern_templates.append(
-        (re.compile(r'(\<|\b)' + _template + r'\s*\<'),
+        (re.compile(_TemplatePattern(_template)),
          _template + '<>',
          _header))
 
+# Prefilters of the lists above built by _TemplateNamesFilter, by id of the
+# list, as (copy of the list, prefilter).
+_template_names_filters = {}
+
+
+def _TemplateNamesFilter(patterns, name_of, make_pattern, follows):
+  """Returns a prefilter of the current contents of a list of patterns.
+
+  Each pattern made by make_pattern can only match where its template name
+  is followed by the text that follows matches.  Rather than trying all of
+  them on every line, a single search for any of the names picks the few
+  worth trying.  As the names consist of word characters only, a name
+  found at a word boundary can never hide another one.  Entries that were
+  not made by make_pattern, e.g. added by other scripts, are always tried.
+  The prefilter is rebuilt whenever the list has changed, so this is to be
+  called again for each file.
+
+  Args:
+    patterns: A list of (pattern, template, header) tuples.
+    name_of: A function mapping a template of patterns to its name.
+    make_pattern: The function that made the patterns of the list.
+    follows: A regular expression for the text after a template name.
+
+  Returns:
+    A tuple (patterns, name_of, names_pattern, unfiltered) for
+    _CandidatePatterns, where names_pattern is a compiled pattern matching
+    any of the template names, or None, and unfiltered the entries that
+    are always tried.
+  """
+  cached = _template_names_filters.get(id(patterns))
+  if cached is None or cached[0] != patterns:
+    names = []
+    unfiltered = []
+    for entry in patterns:
+      name = name_of(entry[1])
+      if (Match(r'\w+$', name) and
+          entry[0].pattern == make_pattern(name)):
+        names.append(name)
+      else:
+        unfiltered.append(entry)
+    names_pattern = None
+    if names:
+      names_pattern = re.compile(
+          r'\b(' + '|'.join(names) + r')(?=' + follows + ')')
+    cached = (list(patterns),
+              (patterns, name_of, names_pattern, unfiltered))
+    _template_names_filters[id(patterns)] = cached
+  return cached[1]
+
+
+def _CandidatePatterns(line, prefilter):
+  """Returns the patterns that may match the line, in order.
+
+  Args:
+    line: The line to search.
+    prefilter: The prefilter of the patterns, from _TemplateNamesFilter.
+
+  Returns:
+    The (pattern, template, header) tuples whose template name occurs in
+    the line, and those that are tried on every line.
+  """
+  patterns, name_of, names_pattern, unfiltered = prefilter
+  names = set()
+  if names_pattern:
+    names = set(match.group(1) for match in names_pattern.finditer(line))
+  if not names and not unfiltered:
+    return []
+  return [entry for entry in patterns
+          if name_of(entry[1]) in names or entry in unfiltered]
+
 
 def FilesBelongToSameModule(filename_cc, filename_h):
   """Check if these two filenames belong to the same module.
@@ -5962,20 +6360,38 @@ def UpdateIncludeState(filename, include_dict, io=codecs):
   Returns:
     True if a header was successfully added. False otherwise.
   """
+  key = (filename, io)
+  if key not in _header_includes:
+    _header_includes[key] = _ReadIncludes(filename, io)
+  includes = _header_includes[key]
+  if includes is None:
+    return False
+  for include, linenum in includes:
+    include_dict.setdefault(include, linenum)
+  return True
+
+
+# Headers are included by many source files of a run, but only read once.
+# Maps (filename, io) to the includes found by _ReadIncludes.
+_header_includes = {}
+
+
+def _ReadIncludes(filename, io):
+  """Returns the (include, linenum) pairs of a file, or None if unreadable."""
   headerfile = None
   try:
     headerfile = io.open(filename, 'r', 'utf8', 'replace')
   except IOError:
-    return False
+    return None
+  includes = []
   linenum = 0
   for line in headerfile:
     linenum += 1
     clean_line = CleanseComments(line)
     match = _RE_PATTERN_INCLUDE.search(clean_line)
     if match:
-      include = match.group(2)
-      include_dict.setdefault(include, linenum)
-  return True
+      includes.append((match.group(2), linenum))
+  return includes
 
 
 def CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error,
@@ -5999,6 +6415,13 @@ def CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error,
   required = {}  # A map of header name to linenumber and the template entity.
                  # Example of required: { '<functional>': (1219, 'less<>') }
 
+  maybe_templates = _TemplateNamesFilter(
+      _re_pattern_headers_maybe_templates, lambda template: template,
+      _MaybeTemplatePattern, '[<(]')
+  templates = _TemplateNamesFilter(
+      _re_pattern_templates, lambda template: template[:-len('<>')],
+      _TemplatePattern, r'\s*<')
+
   for linenum in xrange(clean_lines.NumLines()):
     line = clean_lines.elided[linenum]
     if not line or line[0] == '#':
@@ -6013,7 +6436,8 @@ def CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error,
       if prefix.endswith('std::') or not prefix.endswith('::'):
         required['<string>'] = (linenum, 'string')
 
-    for pattern, template, header in _re_pattern_headers_maybe_templates:
+    for pattern, template, header in _CandidatePatterns(
+        line, maybe_templates):
       if pattern.search(line):
         required[header] = (linenum, template)
 
@@ -6021,7 +6445,7 @@ def CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error,
     if not '<' in line:  # Reduces the cpu time usage by skipping lines.
       continue
 
-    for pattern, template, header in _re_pattern_templates:
+    for pattern, template, header in _CandidatePatterns(line, templates):
       matched = pattern.search(line)
       if matched:
         # Don't warn about IWYU in non-STL namespaces:
@@ -6077,28 +6501,14 @@ def CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error,
 #            'Add #include ' + required_header_unstripped + ' for ' + template)
 
 
-_RE_PATTERN_EXPLICIT_MAKEPAIR = re.compile(r'\bmake_pair\s*<')
-
-
-def CheckMakePairUsesDeduction(filename, clean_lines, linenum, error):
-  """Check that make_pair's template arguments are deduced.
-
-  G++ 4.6 in C++11 mode fails badly if make_pair's template arguments are
-  specified explicitly, and such use isn't intended in any case.
-
-  Args:
-    filename: The name of the current file.
-    clean_lines: A CleansedLines instance containing the file.
-    linenum: The number of the line to check.
-    error: The function to call with any errors found.
-  """
-  line = clean_lines.elided[linenum]
-  match = _RE_PATTERN_EXPLICIT_MAKEPAIR.search(line)
-  if match:
-    error(filename, linenum, 'build/explicit_make_pair',
-          4,  # 4 = high confidence
-          'For C++11-compatibility, omit template arguments from make_pair'
-          ' OR use pair directly OR if appropriate, construct a pair directly')
+# make_pair's template arguments are to be deduced.  G++ 4.6 in C++11 mode
+# fails badly if make_pair's template arguments are specified explicitly, and
+# such use isn't intended in any case.
+RegisterLinePatternCheck(
+    r'\bmake_pair\s*<', 'build/explicit_make_pair',
+    4,  # 4 = high confidence
+    'For C++11-compatibility, omit template arguments from make_pair'
+    ' OR use pair directly OR if appropriate, construct a pair directly')
 
 
 def CheckRedundantVirtual(filename, clean_lines, linenum, error):
@@ -6251,11 +6661,10 @@ def CheckNamespaceOrUsing(filename, clean_lines, linenum, error):
     error(filename, linenum, 'readability/namespace', 4,
           'Do not use using')
 
-def CheckForEndl(filename, clean_lines, linenum, error):
-  """Check that the line does not contain std::endl."""
-  line = clean_lines.elided[linenum]
-  if Match(r'[^a-zA-Z0-9_]*std::endl[^a-zA-Z0-9_]*', line):
-    error(filename, linenum, 'runtime/endl', 4, 'Do not use std::endl')
+# Lines are not to contain std::endl.
+RegisterLinePatternCheck(
+    r'^[^a-zA-Z0-9_]*std::endl', 'runtime/endl', 4, 'Do not use std::endl',
+    stage='late')
 
 def ProcessLine(filename, file_extension, clean_lines, line,
                 include_state, function_state, nesting_state, error, module_deps,
@@ -6292,13 +6701,10 @@ def ProcessLine(filename, file_extension, clean_lines, line,
   CheckForNonConstReference(filename, clean_lines, line, nesting_state, error)
   CheckForNonStandardConstructs(filename, clean_lines, line,
                                 nesting_state, error)
-  CheckVlogArguments(filename, clean_lines, line, error)
-  CheckPosixThreading(filename, clean_lines, line, error)
-  CheckInvalidIncrement(filename, clean_lines, line, error)
-  CheckMakePairUsesDeduction(filename, clean_lines, line, error)
+  CheckLinePatterns(filename, clean_lines, line, error)
   CheckRedundantVirtual(filename, clean_lines, line, error)
   CheckNamespaceOrUsing(filename, clean_lines, line, error)
-  CheckForEndl(filename, clean_lines, line, error)
+  CheckLinePatterns(filename, clean_lines, line, error, stage='late')
   for check_fn in extra_check_functions:
     check_fn(filename, clean_lines, line, error)
 
@@ -6407,6 +6813,7 @@ def ProcessFileData(filename, file_extension, lines, error,
   CheckForFunctionCommentHeaders(filename, lines, error)
   ProcessGlobalSuppresions(lines)
   RemoveMultiLineComments(filename, lines, error)
+  IndexNolintComments(lines)
   clean_lines = CleansedLines(lines)
 
   if IsHeaderExtension(file_extension):
@@ -6419,7 +6826,8 @@ def ProcessFileData(filename, file_extension, lines, error,
     FlagCxx11Features(filename, clean_lines, line, error)
   nesting_state.CheckCompletedBlocks(filename, error)
 
-  CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error)
+  if not _IsFiltered('build/include_what_you_use'):
+    CheckForIncludeWhatYouUse(filename, clean_lines, include_state, error)
 
   # Check that the .cc file has included its header if it exists.
   if _IsSourceExtension(file_extension):
@@ -6611,10 +7019,94 @@ def ProcessFile(filename, vlevel, extra_check_functions=[]):
         Error(filename, linenum, 'whitespace/newline', 1,
               'Unexpected \\r (^M) found; better to use only \\n')
 
+  _cpplint_state.FlushOutput()
   sys.stdout.write('# Done processing %s\n' % path_from_root)
   _RestoreFilters()
 
 
+# Functions that are profiled in addition to the Check* and Flag* ones.
+_PROFILED_FUNCTIONS = ('IndexNolintComments', 'ParseNolintSuppressions',
+                       'ProcessGlobalSuppresions',
+                       'RemoveMultiLineComments', 'ProcessLine',
+                       'ProcessFileData')
+
+
+class _Profiler(object):
+  """Records time, calls and errors per check function and per file.
+
+  Profiling replaces the profiled functions of this module with timing
+  wrappers, so that it costs nothing unless it is enabled.
+  """
+
+  def __init__(self):
+    self.checks = {}  # function name to [seconds, calls, errors]
+    self.files = {}   # file name to [seconds, errors]
+    self._running = set()
+
+  def Enable(self):
+    """Replaces the profiled functions by wrappers recording their stats."""
+    module = sys.modules[__name__]
+    for name, fn in vars(module).items():
+      if (isinstance(fn, types.FunctionType) and
+          (Match(r'(Check|Flag)[A-Z]', name) or name in _PROFILED_FUNCTIONS)):
+        setattr(module, name, self._Wrap(name, fn, self.checks, name))
+    NestingState.Update = self._Wrap(
+        'NestingState.Update', NestingState.Update, self.checks,
+        'NestingState.Update')
+    module.ProcessFile = self._Wrap(
+        'ProcessFile', ProcessFile, self.files, None)
+
+  def _Wrap(self, name, fn, table, key):
+    """Returns fn, recording its stats in table under key.
+
+    A key of None means the first argument of the call, as for ProcessFile.
+    """
+    def Profiled(*args, **kwargs):
+      # Only the outermost of recursive calls is counted.
+      if name in self._running:
+        return fn(*args, **kwargs)
+      self._running.add(name)
+      errors = _cpplint_state.error_count
+      start = timeit.default_timer()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        seconds = timeit.default_timer() - start
+        self._running.discard(name)
+        stats = table.setdefault(args[0] if key is None else key,
+                                 [0.0, 0, 0])
+        stats[0] += seconds
+        stats[1] += 1
+        stats[2] += _cpplint_state.error_count - errors
+    return Profiled
+
+  def PrintTable(self, max_files=20):
+    """Prints the stats of all checks and of the slowest files to stderr."""
+    sys.stderr.write('%-45s %10s %10s %8s\n' %
+                     ('Check', 'Seconds', 'Calls', 'Errors'))
+    for name, (seconds, calls, errors) in sorted(
+        self.checks.iteritems(), key=lambda item: -item[1][0]):
+      sys.stderr.write('%-45s %10.3f %10d %8d\n' %
+                       (name, seconds, calls, errors))
+    sys.stderr.write('\n%-56s %10s %8s\n' % ('File', 'Seconds', 'Errors'))
+    for name, (seconds, _, errors) in sorted(
+        self.files.iteritems(), key=lambda item: -item[1][0])[:max_files]:
+      sys.stderr.write('%-56s %10.3f %8d\n' % (name, seconds, errors))
+
+  def WriteJson(self, filename):
+    """Writes the stats of all checks and files to filename."""
+    with open(filename, 'w') as f:
+      json.dump({
+          'checks': dict((name, {'seconds': seconds, 'calls': calls,
+                                 'errors': errors})
+                         for name, (seconds, calls, errors)
+                         in self.checks.iteritems()),
+          'files': dict((name, {'seconds': seconds, 'errors': errors})
+                        for name, (seconds, _, errors)
+                        in self.files.iteritems()),
+          }, f, indent=2, sort_keys=True)
+
+
 def PrintUsage(message):
   """Prints a brief usage string and exits, optionally with an error message.
 
@@ -6655,7 +7147,9 @@ def ParseArguments(args):
                                                  'root=',
                                                  'linelength=',
                                                  'extensions=',
-                                                 'headers='])
+                                                 'headers=',
+                                                 'profile',
+                                                 'profile-json='])
   except getopt.GetoptError:
     PrintUsage('Invalid arguments.')
 
@@ -6698,6 +7192,11 @@ def ParseArguments(args):
           PrintUsage('Extensions must be comma seperated list.')
     elif opt == '--headers':
       ProcessHppHeadersOption(val)
+    elif opt == '--profile':
+      _cpplint_state.profiler = _Profiler()
+    elif opt == '--profile-json':
+      _cpplint_state.profiler = _Profiler()
+      _cpplint_state.profile_json = val
 
   if not filenames:
     PrintUsage('No files were specified.')
@@ -6720,11 +7219,21 @@ def main():
                                          codecs.getwriter('utf8'),
                                          'replace')
 
+  profiler = _cpplint_state.profiler
+  if profiler:
+    profiler.Enable()
+
   _cpplint_state.ResetErrorCounts()
   for filename in filenames:
     ProcessFile(filename, _cpplint_state.verbose_level)
+  _cpplint_state.FlushOutput()
   _cpplint_state.PrintErrorCounts()
 
+  if profiler:
+    profiler.PrintTable()
+    if _cpplint_state.profile_json:
+      profiler.WriteJson(_cpplint_state.profile_json)
+
   sys.exit(_cpplint_state.error_count > 0)
 
 
@@ -0,0 +1,251 @@
+"""
+Measure how fast cpplint lints a fixed corpus, and catch slowdowns.
+
+Run this from CBMC's top-level directory with the Python that runs
+cpplint. The corpus consists of the .h and .cpp files under src and
+jbmc/src, as of a git revision so that it does not change along with the
+working tree, and of generated files that stress the checks: very long lines, many string and character literals, deeply
+nested expressions and one huge function body. All files are read into
+memory up front, and output goes to /dev/null.
+
+Time is split into phases: building CleansedLines, RemoveMultiLineComments,
+the checks run by ProcessLine, writing errors, and everything else. Each
+phase excludes the time of the phases nested in it.
+
+    cpplint_benchmark.py --save baseline.json
+    (change cpplint.py)
+    cpplint_benchmark.py --compare baseline.json
+
+fails if the throughput dropped by more than --threshold. The baseline
+records the commit the corpus was taken from (HEAD by default), and the
+comparison lints the same commit, unless another --revision is given. Runs
+on different corpora are not compared.
+"""
+
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import cpplint
+
+
+PHASES = ['CleansedLines', 'RemoveMultiLineComments', 'ProcessLine',
+          'output', 'other']
+
+
+def resolve(revision):
+    """ Return the commit hash that revision names.  """
+    return subprocess.check_output(
+        ['git', 'rev-parse', '--verify', revision + '^{commit}']
+    ).decode('utf-8').strip()
+
+
+def read_sources(dirs, revision):
+    """ Return (path, lines) for every .h and .cpp file under dirs.  """
+    paths = subprocess.check_output(
+        ['git', 'ls-tree', '-r', '--name-only', revision, '--'] + dirs)
+    paths = [p for p in paths.decode('utf-8').splitlines()
+             if p.endswith('.h') or p.endswith('.cpp')]
+    cat = subprocess.Popen(['git', 'cat-file', '--batch'],
+                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, _ = cat.communicate(''.join(
+        '%s:%s\n' % (revision, p) for p in paths).encode('utf-8'))
+    sources = []
+    pos = 0
+    for path in paths:
+        header_end = out.index(b'\n', pos)
+        size = int(out[pos:header_end].split()[2])
+        contents = out[header_end + 1:header_end + 1 + size]
+        pos = header_end + 1 + size + 1
+        # As cpplint.ProcessFile reads files.
+        lines = contents.decode('utf-8', 'replace').split('\n')
+        sources.append((path, [l.rstrip('\r') for l in lines]))
+    return sources
+
+
+def synthetic_sources():
+    """ Return (path, lines) for files that stress particular checks.  """
+    long_lines = ['int x%d = %s;' % (i, ' + '.join(
+        'f(a%d, b[%d])' % (j, j) for j in range(150))) for i in range(200)]
+    quotes = ['const char *s%d = "a \\"quoted\\" %d" "\'" \'"\' \'\\\'\';'
+              % (i, i) + ' // "comment"' for i in range(2000)]
+    nesting = ['int deep%d = ' % i + '(' * 200 + 'x' + ')' * 200 + ';'
+               for i in range(100)]
+    nesting += ['{' * i for i in range(1, 60)] + ['}' * i
+                                                  for i in range(59, 0, -1)]
+    body = ['void huge()', '{']
+    for i in range(5000):
+        body.append('  if(v[%d] < w[%d])' % (i, i))
+        body.append('    v[%d] = std::max<int>(w[%d], v[%d]);' % (i, i, i))
+    body.append('}')
+    return [
+        ('synthetic/long_lines.cpp', long_lines),
+        ('synthetic/quotes.cpp', quotes),
+        ('synthetic/nesting.cpp', nesting),
+        ('synthetic/huge_function.cpp', body)]
+
+
+def corpus_info(sources):
+    digest = hashlib.sha1()
+    lines = 0
+    for path, contents in sources:
+        digest.update(path.encode('utf-8'))
+        for line in contents:
+            digest.update(line.encode('utf-8') + b'\n')
+        lines += len(contents)
+    return {'files': len(sources), 'lines': lines,
+            'digest': digest.hexdigest()}
+
+
+class PhaseTimer(object):
+    """
+    Wraps functions so that the time spent in them is added to a phase,
+    excluding the time spent in wrapped functions they call.
+    """
+    def __init__(self):
+        self.seconds = dict((phase, 0.0) for phase in PHASES)
+        self.nested = []
+
+    def wrap(self, phase, fn):
+        def timed(*args, **kwargs):
+            start = timeit.default_timer()
+            self.nested.append(0.0)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = timeit.default_timer() - start
+                self.seconds[phase] += elapsed - self.nested.pop()
+                if self.nested:
+                    self.nested[-1] += elapsed
+        return timed
+
+
+def run(sources):
+    """ Lint all sources once; return the seconds per phase and errors.  """
+    timer = PhaseTimer()
+    originals = dict((name, getattr(cpplint, name)) for name in
+                     ['CleansedLines', 'RemoveMultiLineComments',
+                      'ProcessLine'])
+    for name, fn in originals.items():
+        setattr(cpplint, name, timer.wrap(name, fn))
+    error = timer.wrap('output', cpplint.Error)
+    process = timer.wrap('other', cpplint.ProcessFileData)
+    flush = timer.wrap('output', cpplint._cpplint_state.FlushOutput)
+
+    stderr = sys.stderr
+    sys.stderr = codecs.StreamReaderWriter(open(os.devnull, 'w'),
+                                           codecs.getreader('utf8'),
+                                           codecs.getwriter('utf8'),
+                                           'replace')
+    cpplint._cpplint_state.ResetErrorCounts()
+    try:
+        for path, lines in sources:
+            process(path, os.path.splitext(path)[1][1:], list(lines), error)
+            # As cpplint.ProcessFile writes the errors of each file.
+            flush()
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+        for name, fn in originals.items():
+            setattr(cpplint, name, fn)
+    return timer.seconds, cpplint._cpplint_state.error_count
+
+
+def measure(sources, repeat):
+    """ Return the result of the fastest of repeat runs.  """
+    best = None
+    for _ in range(repeat):
+        seconds, errors = run(sources)
+        total = sum(seconds.values())
+        if best is None or total < best['total']:
+            best = {'total': total, 'phases': seconds, 'errors': errors}
+    best['corpus'] = corpus_info(sources)
+    best['lines_per_second'] = best['corpus']['lines'] / best['total']
+    best['python'] = platform.python_version()
+    return best
+
+
+def report(result, baseline=None):
+    print('%d files, %d lines, %d errors' % (
+        result['corpus']['files'], result['corpus']['lines'],
+        result['errors']))
+    for phase in PHASES + ['total']:
+        seconds = (result['total'] if phase == 'total'
+                   else result['phases'][phase])
+        line = '%-25s %8.3f s' % (phase, seconds)
+        if baseline:
+            before = (baseline['total'] if phase == 'total'
+                      else baseline['phases'].get(phase, 0.0))
+            line += '  (was %8.3f s)' % before
+        print(line)
+    print('%-25s %8.0f lines/s' % ('throughput', result['lines_per_second']))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dirs', nargs='*', default=['src', 'jbmc/src'],
+            help='Directories to lint (default: src jbmc/src)')
+    parser.add_argument('--revision',
+            help='Git revision to take the files from (default: that of '
+                 'the --compare baseline, or HEAD)')
+    parser.add_argument('--no-synthetic', action='store_true',
+            help='Leave out the generated stress files')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='Number of runs; the fastest is reported')
+    parser.add_argument('--save', metavar='FILE',
+            help='Write the results to FILE as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+            help='Compare with the baseline in FILE')
+    parser.add_argument('--threshold', type=float, default=0.1,
+            help='Fail the comparison if throughput dropped by more than '
+                 'this fraction (default: 0.1)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    revision = args.revision
+    if revision is None:
+        revision = baseline.get('revision', 'HEAD') if baseline else 'HEAD'
+    revision = resolve(revision)
+
+    sources = read_sources(args.dirs, revision)
+    if not args.no_synthetic:
+        sources += synthetic_sources()
+    corpus = corpus_info(sources)
+    if baseline and baseline['corpus'] != corpus:
+        print('error: the baseline was measured on a different corpus '
+              '(%d files, %d lines) than this one (%d files, %d lines)' % (
+                  baseline['corpus']['files'], baseline['corpus']['lines'],
+                  corpus['files'], corpus['lines']))
+        return 2
+
+    result = measure(sources, args.repeat)
+    result['revision'] = revision
+    report(result, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    if baseline:
+        change = result['lines_per_second'] / baseline['lines_per_second'] - 1
+        print('throughput change: %+.1f%%' % (change * 100))
+        if change < -args.threshold:
+            print('FAILED: throughput dropped by more than %.1f%%' %
+                  (args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
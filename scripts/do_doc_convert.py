@@ -1,40 +1,82 @@
 from reformat_docs import convert_file
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser
+from functools import partial
 from os import walk
 from os.path import join
-from sys import exit
-from re import match
+from sys import exit, stderr
+import re
 
 """
 Run this from CBMC's top-level directory.
 """
 
-def main():
-    IGNORE_LIST = [
-            r'src/big-int/.*',
-            r'src/miniz/.*',
-            r'src/ansi-c/arm_builtin_headers.h',
-            r'src/ansi-c/clang_builtin_headers.h',
-            r'src/ansi-c/cw_builtin_headers.h',
-            r'src/ansi-c/gcc_builtin_headers_alpha.h',
-            r'src/ansi-c/gcc_builtin_headers_arm.h',
-            r'src/ansi-c/gcc_builtin_headers_generic.h',
-            r'src/ansi-c/gcc_builtin_headers_ia32-2.h',
-            r'src/ansi-c/gcc_builtin_headers_ia32.h',
-            r'src/ansi-c/gcc_builtin_headers_mips.h',
-            r'src/ansi-c/gcc_builtin_headers_power.h',
-            r'src/ansi-c/library/cprover.h']
-
-    MATCH_EXPR = r'.*\.(h|cpp)'
-
-    for root, dirs, files in walk('src'):
+IGNORE_LIST = [
+        r'src/big-int/.*',
+        r'src/miniz/.*',
+        r'src/ansi-c/arm_builtin_headers.h',
+        r'src/ansi-c/clang_builtin_headers.h',
+        r'src/ansi-c/cw_builtin_headers.h',
+        r'src/ansi-c/gcc_builtin_headers_alpha.h',
+        r'src/ansi-c/gcc_builtin_headers_arm.h',
+        r'src/ansi-c/gcc_builtin_headers_generic.h',
+        r'src/ansi-c/gcc_builtin_headers_ia32-2.h',
+        r'src/ansi-c/gcc_builtin_headers_ia32.h',
+        r'src/ansi-c/gcc_builtin_headers_mips.h',
+        r'src/ansi-c/gcc_builtin_headers_power.h',
+        r'src/ansi-c/library/cprover.h']
+
+MATCH_EXPR = r'.*\.(h|cpp)'
+
+
+def files_to_convert(top):
+    """ Yield the files under top that should be converted.  """
+    ignore_re = re.compile('|'.join('(?:%s)' % i for i in IGNORE_LIST))
+    match_re = re.compile(MATCH_EXPR)
+    for root, dirs, files in walk(top):
         for file in files:
             path = join(root, file)
-            if any(map(lambda x: match(x, path), IGNORE_LIST)):
-                print 'ignoring', path
+            if ignore_re.match(path):
+                print('ignoring', path)
                 continue
-            if not match(MATCH_EXPR, path):
+            if not match_re.match(path):
                 continue
-            convert_file(path, True)
+            yield path
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help='Number of files to convert in parallel '
+                 '(default: one per CPU)')
+    parser.add_argument('--check', action='store_true',
+            help='Only report the files that would be changed; exit with '
+                 'status 1 if there are any')
+    args = parser.parse_args()
+
+    convert = partial(convert_file, inplace=True, quiet=True,
+            check=args.check)
+    blocks = 0
+    warnings = 0
+    changed = 0
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for result in pool.map(convert, files_to_convert('src'),
+                chunksize=16):
+            for message in result.warnings:
+                stderr.write('Warning: %s\n' % message)
+            if result.changed or result.warnings:
+                print('%s: %d blocks converted, %d warnings%s' %
+                        (result.file, result.blocks, len(result.warnings),
+                         ' (would change)' if args.check else ''))
+            blocks += result.blocks
+            warnings += len(result.warnings)
+            changed += result.changed
+
+    print('%d blocks converted, %d warnings, %d files %s' %
+            (blocks, warnings, changed,
+             'would change' if args.check else 'changed'))
+    return 1 if args.check and changed else 0
+
 
 if __name__ == '__main__':
     exit(main())
@@ -7,11 +7,17 @@
 
 
 import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
 import json
 import logging
 from   logging import error, warning, info, debug
+import mmap
+import operator
 import os
 import re
+import struct
 import subprocess
 import sys
 import textwrap
@@ -94,25 +100,39 @@ def get_linker_script_data(script):
                                      r"(?P<orig>0x[a-fA-F0-9]+)\s*,\s*"
                                      r"LENGTH\s*=\s*(?P<len>\d+)\s*"
                                      r"(?P<unit>[KMG])")
-    exp = r"(ORIGIN\(\w+\)|LENGTH\(\w+\))"
-    op  = r"(\+|\-)"
-    assign_expr     = re.compile(r"\s(?P<sym>\w+)\s*=\s*"
-                                  r"(?P<expr>{exp}(\s*{op}\s*{exp})*)"
-                                  r"\s*;".format(exp=exp, op=op))
+    # Only expressions involving a memory block are of interest. The
+    # expression itself is split into tokens by compile_expr, which keeps
+    # this regex free of nested repetition.
+    assign_expr     = re.compile(r"\s(?P<sym>\w+)\s*="
+                                  r"(?=[^;{}]*\b(ORIGIN|LENGTH)\s*\()"
+                                  r"(?P<expr>[^;{}]*);")
 
     # If we match a regex, call the right function to update the state
-    # with the info gleaned from the matched string.
-    jump_table = {
-        close_brace     : close_brace_fun,
-        uwnknown_cmd    : unknown_cmd_fun,
-        memory_cmd      : memory_cmd_fun,
-        sections_cmd    : sections_cmd_fun,
-        assign_current  : assign_current_fun,
-        memory_block    : memory_block_fun,
-        sec_def         : sec_def_fun,
-        assign_size     : assign_size_fun,
-        assign_expr     : assign_expr_fun,
-    }
+    # with the info gleaned from the matched string. Every regex starts
+    # by matching a single whitespace; the third column describes the
+    # character that must follow that whitespace for the regex to have
+    # any chance of matching.
+    jump_table = [
+        ("close_brace",    close_brace,    r"}",       close_brace_fun),
+        ("uwnknown_cmd",   uwnknown_cmd,   r"P",       unknown_cmd_fun),
+        ("memory_cmd",     memory_cmd,     r"M",       memory_cmd_fun),
+        ("sections_cmd",   sections_cmd,   r"S",       sections_cmd_fun),
+        ("assign_current", assign_current, r"\w",      assign_current_fun),
+        ("memory_block",   memory_block,   r"\w",      memory_block_fun),
+        ("sec_def",        sec_def,        r"[-\.\w/]", sec_def_fun),
+        ("assign_size",    assign_size,    r"\w",      assign_size_fun),
+        ("assign_expr",    assign_expr,    r"\w",      assign_expr_fun),
+    ]
+
+    # Positions where some regex in the jump table could start matching.
+    # Everything in between is skipped over in one go, rather than
+    # trying every regex at every character.
+    token_start = re.compile(r"\s(?=%s)" % "|".join(
+        lead for _, _, lead, _ in jump_table))
+
+    # Maps the character following a token-starting whitespace to the
+    # entries of the jump table that could match there.
+    candidates = {}
 
     # Whenever we match an interesting regex, we'll update the state
     # with whatever information we want to rip from that bit of text.
@@ -153,76 +173,84 @@ def get_linker_script_data(script):
 
     i = 0
     while i < len(text):
-        buf = text[i:]
-        i += 1
         asrt(not (state["MEM"] and state["SEC"]),
-             "memory & sections", buf)
+             "memory & sections", text, i)
         asrt(not state["DEF"] or state["SEC"],
-             "def outside SECTION", buf)
+             "def outside SECTION", text, i)
+
+        start = token_start.search(text, i)
+        if start is None:
+            clobber(state, text, i)
+            break
+        j = start.start()
+        if j > i:
+            clobber(state, text, i)
+
+        lead = text[j + 1]
+        if lead not in candidates:
+            candidates[lead] = [entry for entry in jump_table
+                                if re.match(entry[2], lead)]
 
         jump_fun = None
-        matched_str = None
         matched_re = None
         match = None
-        for regex, fun in jump_table.items():
-            m = regex.match(buf)
+        for name, regex, _, fun in candidates[lead]:
+            m = regex.match(text, j)
             if m:
                 if jump_fun is not None:
-                    error("matched multiple regexes\n%s", buf)
+                    error("matched multiple regexes\n%s", text[j:])
                     exit(1)
                 jump_fun = fun
                 match = m
-                matched_str = buf[m.span()[0]:m.span()[1]]
-                for s, v in locals().items():
-                    if v is regex and s is not "regex":
-                        matched_re = s
+                matched_re = name
         if jump_fun is not None:
-            info("regex '%s' matched '%s'", matched_re, matched_str)
-            jump_fun(state, match, buf)
-            i = i + match.span()[1] - 1
+            info("regex '%s' matched '%s'", matched_re, match.group(0))
+            jump_fun(state, match)
+            i = match.end()
         else:
-            debug("Clobbering due to '%s'...", buf[:20])
-            # There may have been some intermediate command between the
-            # start of a section definition and where we are. So we have
-            # no idea what address the current address pointer refers to
-            state["start-valid"] = None
-            # There may have been an intermediate command between the
-            # last assignment and the end of the section.
-            state["end-valid"] = None
+            clobber(state, text, j)
+            i = j + 1
     match_up_expr_assigns(state)
     return state
 
 
-def assign_expr_fun(state, match, _):
+def clobber(state, text, i):
+    debug("Clobbering due to '%s'...", text[i:i + 20])
+    # There may have been some intermediate command between the start
+    # of a section definition and where we are. So we have no idea what
+    # address the current address pointer refers to
+    state["start-valid"] = None
+    # There may have been an intermediate command between the last
+    # assignment and the end of the section.
+    state["end-valid"] = None
+
+
+def assign_expr_fun(state, match):
     # Do NOT invalidate 'start-valid' here. Assignments from expressions
     # do not actually advance the current address pointer.
     sym, expr = match.group("sym"), match.group("expr")
-    origin_pat = r"ORIGIN\((?P<block>\w+?)\)"
-    origins = re.findall(origin_pat, expr)
+    try:
+        ast = compile_expr(expr)
+    except ValueError as e:
+        # Something we do not understand, such as ALIGN relative to the
+        # current address, so we may no longer know where that points.
+        info("Unable to parse '%s', skipping: %s", expr, e)
+        clobber(state, match.string, match.start())
+        return
+    origins = [node[1] for node in walk_expr(ast) if node[0] == "ORIGIN"]
     if len(origins) != 1:
         info("assign with %d origins, skipping: %s", len(origins),
-               match.string())
+             match.group(0))
         return
-    ret = {"origin": origins[0], "sym": sym}
-    for block_name, data in state["blocks"].items():
-        for op in ["ORIGIN", "LENGTH"]:
-            old_expr = str(expr)
-            expr = re.sub(r"%s\(%s\)" % (op, block_name), str(data[op]),
-                          expr)
-            if expr != old_expr:
-                info("Subbed %s(%s) with %d", op, block_name, data[op])
-    info("Final expression is '%s'. Evaluating; "
-         "may the angels have mercy on my soul.", expr)
-    try:
-        ret["addr"] = eval(expr)
-    except RuntimeError:
-        warning("Unable to evaluate '%s'" , expr)
-    info("Evaluated '%s' to %d", expr, ret["addr"])
-    state["expr-assigns"].append(ret)
+    info("'%s' is assigned '%s'", sym, expr)
+    # The expression is evaluated once the whole script has been read,
+    # in match_up_expr_assigns.
+    state["expr-assigns"].append({"origin": origins[0], "sym": sym,
+                                  "ast": ast})
 
 
-def sec_def_fun(state, match, buf):
-    asrt(not state["DEF"], "nested sec def", buf)
+def sec_def_fun(state, match):
+    asrt(not state["DEF"], "nested sec def", match.string, match.start())
     state["DEF"] = True
     sec = match.group("sec")
     info("Current section is now '%s'", sec)
@@ -230,8 +258,9 @@ def sec_def_fun(state, match, buf):
     state["start-valid"] = True
 
 
-def assign_size_fun(state, match, buf):
-    asrt(state["SEC"], "assignment outside SECTIONS", buf)
+def assign_size_fun(state, match):
+    asrt(state["SEC"], "assignment outside SECTIONS",
+         match.string, match.start())
     sec = match.group("sec")
     if sec not in state["sections"]:
         state["sections"][sec] = {}
@@ -240,8 +269,9 @@ def assign_size_fun(state, match, buf):
     state["sections"][sec]["size"] = sym
 
 
-def assign_current_fun(state, match, buf):
-    asrt(state["SEC"], "assignment outside SECTIONS", buf)
+def assign_current_fun(state, match):
+    asrt(state["SEC"], "assignment outside SECTIONS",
+         match.string, match.start())
     sec = state["cur-sec"]
     state["end-valid"] = match
     if state["start-valid"]:
@@ -254,10 +284,11 @@ def assign_current_fun(state, match, buf):
         info("Don't know where we are.")
 
 
-def close_brace_fun(state, _, buf):
+def close_brace_fun(state, match):
     # We might have seen an assignment immediately before this.
     if state["end-valid"]:
-        asrt(state["DEF"], "end-valid outside sec-def", buf)
+        asrt(state["DEF"], "end-valid outside sec-def",
+             match.string, match.start())
         sec = state["cur-sec"]
         if sec in state["sections"]:
             sym = state["end-valid"].group("sym")
@@ -282,13 +313,13 @@ def close_brace_fun(state, _, buf):
         info("Closing unknown command")
         state["UNKNOWN"] = False
     else:
-        error("Not in block\n%s", buf)
+        error("Not in block\n%s", match.string[match.start():])
         traceback.print_stack()
         exit(1)
 
 
-def memory_block_fun(state, m, buf):
-    asrt(state["MEM"], "memory block outside MEMORY", buf)
+def memory_block_fun(state, m):
+    asrt(state["MEM"], "memory block outside MEMORY", m.string, m.start())
     start, length, unit = m.group("orig"), m.group("len"), m.group("unit")
     length = int(length)
     dec_start = int(start, 16)
@@ -305,30 +336,47 @@ def memory_block_fun(state, m, buf):
     state["blocks"][name] = {"ORIGIN": int(start, 16), "LENGTH": length}
 
 
-def sections_cmd_fun(state, _, buf):
-    asrt(not state["SEC"], "encountered SECTIONS twice", buf)
+def sections_cmd_fun(state, match):
+    asrt(not state["SEC"], "encountered SECTIONS twice",
+         match.string, match.start())
     state["SEC"] = True
 
 
-def memory_cmd_fun(state, _, buf):
-    asrt(not state["MEM"], "encountered MEMORY twice", buf)
+def memory_cmd_fun(state, match):
+    asrt(not state["MEM"], "encountered MEMORY twice",
+         match.string, match.start())
     state["MEM"] = True
 
-def unknown_cmd_fun(state, _, buf):
-    asrt(not state["MEM"], "encountered UNKNOWN twice", buf)
+def unknown_cmd_fun(state, match):
+    asrt(not state["MEM"], "encountered UNKNOWN twice",
+         match.string, match.start())
     state["UNKNOWN"] = True
 
 def match_up_expr_assigns(state):
-    blocks = set([data["origin"] for data in state["expr-assigns"]])
+    block_table = state.get("blocks", {})
+    assigns = []
+    for assign in state["expr-assigns"]:
+        ast = assign.pop("ast")
+        try:
+            assign["addr"] = eval_expr(ast, block_table)
+        except ValueError as e:
+            warning("Unable to evaluate assignment to '%s': %s",
+                    assign["sym"], e)
+            continue
+        info("Evaluated '%s' to %d", assign["sym"], assign["addr"])
+        assigns.append(assign)
+    state["expr-assigns"] = assigns
+
+    blocks = dict.fromkeys(data["origin"] for data in assigns)
     for block in blocks:
-        assigns = [a for a in state["expr-assigns"]
-                   if a["origin"] == block]
-        assigns = sorted(assigns, key=(lambda a: a["addr"]))
-        if len(assigns) < 2:
+        block_assigns = [a for a in assigns if a["origin"] == block]
+        block_assigns = sorted(block_assigns, key=(lambda a: a["addr"]))
+        if len(block_assigns) < 2:
             warning("Only 1 assignment to expr involving %s", block)
             continue
-        start_addr, end_addr = assigns[0]["addr"], assigns[-1]["addr"]
-        start_sym, end_sym = assigns[0]["sym"], assigns[-1]["sym"]
+        start_addr = block_assigns[0]["addr"]
+        end_addr = block_assigns[-1]["addr"]
+        start_sym, end_sym = block_assigns[0]["sym"], block_assigns[-1]["sym"]
         info("Valid memory from %s (%d) to %s (%s) [%s block]",
                 start_sym, start_addr, end_sym, end_addr, block)
         tmp = {"start": start_sym, "end": end_sym}
@@ -336,27 +384,222 @@ def match_up_expr_assigns(state):
         state["sections"][sec_name] = tmp
 
 
-def asrt(cond, msg, buf):
+"""Linker script arithmetic. Expressions on the right-hand side of
+assignments are compiled into a small AST of nested tuples, whose first
+element names the node:
+
+    ("num", n)            integer literal (decimal or hex)
+    ("ORIGIN", block)     ORIGIN(block), from the MEMORY command
+    ("LENGTH", block)     LENGTH(block), from the MEMORY command
+    ("ALIGN", e, a)       e rounded up to a multiple of a
+    ("neg", e)            -e
+    (op, l, r)            l op r for op in + - * /
+
+The AST is evaluated against the table of memory blocks once the whole
+script has been parsed, so no text substitution or eval() is needed."""
+EXPR_LEXEME = re.compile(r"\s*(?:(?P<fun>ORIGIN|LENGTH)\s*\(\s*(?P<block>\w+)"
+                         r"\s*\)|(?P<num>0[xX][0-9a-fA-F]+|\d+)"
+                         r"|(?P<punct>ALIGN|[-+*/(),]))")
+
+
+def compile_expr(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = EXPR_LEXEME.match(text, pos)
+        if not m:
+            raise ValueError("unexpected '%s'" % text[pos:].strip())
+        if m.group("fun"):
+            tokens.append((m.group("fun"), m.group("block")))
+        elif m.group("num"):
+            num = m.group("num")
+            base = 16 if num[:2] in ("0x", "0X") else 10
+            tokens.append(("num", int(num, base)))
+        else:
+            tokens.append((m.group("punct"), None))
+        pos = m.end()
+    tokens.append(("end", None))
+
+    # Recursive descent over the token list; pos[0] is the next token.
+    pos = [0]
+
+    def peek():
+        return tokens[pos[0]][0]
+
+    def take(kind=None):
+        tok = tokens[pos[0]]
+        if kind is not None and tok[0] != kind:
+            raise ValueError("expected '%s' but found '%s'" % (kind, tok[0]))
+        pos[0] += 1
+        return tok
+
+    def sum_expr():
+        node = product_expr()
+        while peek() in ("+", "-"):
+            op = take()[0]
+            node = (op, node, product_expr())
+        return node
+
+    def product_expr():
+        node = unary_expr()
+        while peek() in ("*", "/"):
+            op = take()[0]
+            node = (op, node, unary_expr())
+        return node
+
+    def unary_expr():
+        if peek() == "-":
+            take()
+            return ("neg", unary_expr())
+        if peek() == "+":
+            take()
+            return unary_expr()
+        return primary_expr()
+
+    def primary_expr():
+        kind = peek()
+        if kind in ("num", "ORIGIN", "LENGTH"):
+            return take()
+        if kind == "(":
+            take()
+            node = sum_expr()
+            take(")")
+            return node
+        if kind == "ALIGN":
+            take()
+            take("(")
+            node = sum_expr()
+            if peek() != ",":
+                raise ValueError("ALIGN relative to '.' is not supported")
+            take(",")
+            align = sum_expr()
+            take(")")
+            return ("ALIGN", node, align)
+        raise ValueError("unexpected '%s'" % kind)
+
+    ast = sum_expr()
+    take("end")
+    return ast
+
+
+def walk_expr(ast):
+    yield ast
+    if ast[0] not in ("num", "ORIGIN", "LENGTH"):
+        for child in ast[1:]:
+            for node in walk_expr(child):
+                yield node
+
+
+def eval_expr(ast, blocks):
+    kind = ast[0]
+    if kind == "num":
+        return ast[1]
+    if kind in ("ORIGIN", "LENGTH"):
+        if ast[1] not in blocks:
+            raise ValueError("no memory block called '%s'" % ast[1])
+        return blocks[ast[1]][kind]
+    if kind == "neg":
+        return -eval_expr(ast[1], blocks)
+    left, right = eval_expr(ast[1], blocks), eval_expr(ast[2], blocks)
+    if kind == "+":
+        return left + right
+    if kind == "-":
+        return left - right
+    if kind == "*":
+        return left * right
+    if right == 0:
+        raise ValueError("division by zero")
+    if kind == "/":
+        return left // right
+    # ALIGN
+    return (left + right - 1) // right * right
+
+
+def asrt(cond, msg, text, pos=0):
     if not cond:
-        error("%s\n%s", msg, buf)
+        error("%s\n%s", msg, text[pos:])
         exit(1)
 
 
-def needed_definitions(all_symbols, root_dir):
-    ret = []
-    pat = re.compile(r"extern\s+char\s+(?P<var>\w+)\[\];")
+# An extern array declaration at the start of a line. Files are scanned
+# as bytes, so the whitespace classes exclude line breaks explicitly.
+EXTERN_ARRAY = re.compile(rb"^extern[^\S\r\n]+char[^\S\r\n]+"
+                          rb"(?P<var>\w+)\[\];", re.MULTILINE)
+
+
+def extern_arrays_in(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"extern" not in data:
+        return []
+    return [m.group("var").decode() for m in EXTERN_ARRAY.finditer(data)]
+
+
+def source_files(root_dir, exclude):
     allowed = [".c", ".cpp", ".h"]
-    for root, _, files in os.walk(root_dir):
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs
+                   if not any(fnmatch.fnmatch(d, pat) for pat in exclude)]
         for file in files:
-            file = os.path.join(root, file)
             _, ext = os.path.splitext(file)
-            if ext not in allowed:
-                continue
-            with open(file) as f:
-                for line in f:
-                    m = pat.match(line)
-                    if m:
-                        ret.append(m.group("var"))
+            if ext in allowed:
+                yield os.path.join(root, file)
+
+
+def load_scan_cache(cache_file):
+    if cache_file is None:
+        return {}
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_scan_cache(cache_file, cache):
+    if cache_file is None:
+        return
+    tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, cache_file)
+
+
+def needed_definitions(all_symbols, root_dir, exclude=(), jobs=None,
+                       cache_file=None):
+    # Scan the codebase for extern-declared arrays. Files are scanned in
+    # parallel; if cache_file is given, each file's result is stored
+    # there against its mtime and size, so that unchanged files are not
+    # read again on the next run. Directories whose name matches one of
+    # the glob patterns in exclude are not descended into.
+    cache = load_scan_cache(cache_file)
+    new_cache = {}
+    stale = []
+    for path in source_files(root_dir, exclude):
+        st = os.stat(path)
+        key = [st.st_mtime_ns, st.st_size]
+        entry = cache.get(path)
+        if entry is not None and entry[:2] == key:
+            new_cache[path] = entry
+        else:
+            new_cache[path] = None
+            stale.append((path, key))
+    info("%d files to scan, %d cached", len(stale),
+         len(new_cache) - len(stale))
+
+    paths = [path for path, _ in stale]
+    if jobs != 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(extern_arrays_in, paths, chunksize=64))
+    else:
+        results = [extern_arrays_in(path) for path in paths]
+    for (path, key), syms in zip(stale, results):
+        new_cache[path] = key + [syms]
+    save_scan_cache(cache_file, new_cache)
+
+    ret = [v for entry in new_cache.values() for v in entry[2]]
+    all_symbols = set(all_symbols)
     bad = [v for v in ret if v not in all_symbols]
     if bad:
         logging.error("These symbols need definitions but are not "
@@ -366,13 +609,136 @@ def needed_definitions(all_symbols, root_dir):
     return ret
 
 
-def symbols_from(object_file):
+# Layouts of the parts of an ELF file that we need to read the symbol
+# table, for 32- and 64-bit objects. Byte order is prepended at runtime.
+ELF_LAYOUTS = {
+    1: {"ehdr": "16xHHIIIIIHHHHHH", "shdr": "IIIIIIIIII",
+        "sym": "IIIBBH", "addr": "%08x",
+        # Positions of st_name, st_value, st_info and st_shndx
+        "sym-fields": operator.itemgetter(0, 1, 3, 5)},
+    2: {"ehdr": "16xHHIQQQIHHHHHH", "shdr": "IIQQQQIIQQ",
+        "sym": "IBBHQQ", "addr": "%016x",
+        "sym-fields": operator.itemgetter(0, 4, 1, 3)},
+}
+SHT_SYMTAB = 2
+STT_SECTION = 3
+SHN_XINDEX = 0xffff
+
+
+def elf_symbols_from(object_file, needed=None):
+    # Read the symbol table straight out of an ELF file, giving the same
+    # names and addresses that `objdump --syms` would. If needed is not
+    # None, only symbols named in it are returned. Returns None if the
+    # file is not an ELF file with a symbol table, in which case callers
+    # should fall back to objdump.
+    try:
+        with open(object_file, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, ValueError):
+        return None
+    try:
+        return read_elf_symbols(buf, needed)
+    except (struct.error, IndexError):
+        return None
+    finally:
+        buf.close()
+
+
+def read_elf_symbols(buf, needed):
+    # EI_CLASS picks 32 or 64 bit, EI_DATA little (1) or big (2) endian.
+    if (buf[:4] != b"\x7fELF" or buf[4] not in ELF_LAYOUTS
+            or buf[5] not in (1, 2)):
+        return None
+    layout = ELF_LAYOUTS[buf[4]]
+    order = {1: "<", 2: ">"}[buf[5]]
+
+    ehdr = struct.unpack_from(order + layout["ehdr"], buf)
+    shoff, shentsize, shnum, shstrndx = ehdr[5], ehdr[10], ehdr[11], ehdr[12]
+    if not shoff:
+        return None
+    shdr_fmt = order + layout["shdr"]
+    first = struct.unpack_from(shdr_fmt, buf, shoff)
+    # Objects with very many sections keep the real section count and
+    # section name table index in the first section header.
+    if shnum == 0:
+        shnum = first[5]
+    if shstrndx == SHN_XINDEX:
+        shstrndx = first[6]
+    headers = [struct.unpack_from(shdr_fmt, buf, shoff + n * shentsize)
+               for n in range(shnum)]
+
+    def c_string(offset):
+        return buf[offset:buf.find(b"\0", offset)].decode(errors="replace")
+
+    def section_name(index):
+        return c_string(headers[shstrndx][4] + headers[index][0])
+
+    symtab = [h for h in headers if h[1] == SHT_SYMTAB]
+    if not symtab:
+        return None
+    _, _, _, _, sym_off, sym_size, link, _, _, sym_entsize = symtab[0]
+    str_off = headers[link][4]
+    str_end = str_off + headers[link][5]
+
+    # When we only want a few symbols, find the string table offsets of
+    # their names up front; the scan below then never has to look at
+    # the names of symbols that we don't want.
+    wanted = None
+    if needed is not None:
+        needed = set(needed)
+        wanted = set()
+        for name in needed:
+            pat = name.encode() + b"\0"
+            pos = buf.find(pat, str_off, str_end)
+            while pos != -1:
+                wanted.add(pos - str_off)
+                pos = buf.find(pat, pos + 1, str_end)
+
+    sym_fmt = order + layout["sym"]
+    if struct.calcsize(sym_fmt) != sym_entsize:
+        return None
+    fields = layout["sym-fields"]
+
+    ret = {}
+    symbols = memoryview(buf)[sym_off + sym_entsize:sym_off + sym_size]
+    try:
+        for sym in struct.iter_unpack(sym_fmt, symbols):
+            st_name, st_value, st_info, st_shndx = fields(sym)
+            # Like objdump, name section symbols after their section.
+            if (st_info & 0xf) == STT_SECTION and st_shndx < shnum:
+                name = section_name(st_shndx)
+                if needed is not None and name not in needed:
+                    continue
+            elif wanted is not None and st_name not in wanted:
+                continue
+            else:
+                name = c_string(str_off + st_name)
+            ret[name] = layout["addr"] % st_value
+    finally:
+        symbols.release()
+    return ret
+
+
+def symbols_from(object_file, needed=None):
+    ret = elf_symbols_from(object_file, needed)
+    if ret is None:
+        info("Could not read symbol table of '%s' directly, "
+             "falling back to objdump", object_file)
+        ret = objdump_symbols_from(object_file, needed)
+    logging.info("found symbols:\n%s", "\n".join(
+        ["0x%-16s %s" % (v, k) for k, v in ret.items()]))
+    return ret
+
+
+def objdump_symbols_from(object_file, needed=None):
+    if needed is not None:
+        needed = set(needed)
     cmd = ["objdump", "--syms", object_file]
     proc = subprocess.Popen(cmd, universal_newlines=True,
             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    if proc.wait():
-        logging.error("`%s` failed. Output:\n%s", " ".join(cmd),
-                      proc.stdout.read())
+    output, _ = proc.communicate()
+    if proc.returncode:
+        logging.error("`%s` failed. Output:\n%s", " ".join(cmd), output)
         exit(1)
     pat = re.compile(r"(?P<addr>[^\s]+)\s+"
                      r"(?P<flags>[lgu! ][w ][C ][W ][Ii ][Dd ][FfO ])\s+"
@@ -382,7 +748,7 @@ def symbols_from(object_file):
                     )
     matching = False
     ret = {}
-    for line in proc.stdout.read().splitlines():
+    for line in output.splitlines():
         if not line:
             continue
         if not matching and re.match("SYMBOL TABLE:", line):
@@ -395,41 +761,40 @@ def symbols_from(object_file):
             logging.error("Unexpected line from `%s`:\n%s",
                     " ".join(cmd), line)
             exit(1)
-        ret[m.group("name")] = m.group("addr")
-    logging.info("found symbols:\n%s", "\n".join(
-        ["0x%-16s %s" % (v, k) for k, v in ret.items()]))
+        if needed is None or m.group("name") in needed:
+            ret[m.group("name")] = m.group("addr")
     return ret
 
 
 def match_up_addresses(script_data, symbol_table):
+    # Resolve all sections of the linker script against the symbol table
+    # at once, keeping the ones whose extent we could work out. Lookups
+    # are by symbol name, so this stays cheap however many symbols the
+    # object file has.
     ret = []
     for name, data in script_data["sections"].items():
-        ok = False
-        if "size" in data and "start" in data:
-            ok = True
-        if "end" in data and "start" in data:
-            ok = True
-        if not ok:
-            continue
-        region = {}
-        for sym, value in symbol_table.items():
-            if "size" in data and sym == data["size"]:
-                region["size"] = {"sym": sym, "val": value}
-            if "start" in data and sym == data["start"]:
-                region["start"] = {"sym": sym, "val": value}
-            if "end" in data and sym == data["end"]:
-                region["end"] = {"sym": sym, "val": value}
-            region["section"] = name
-        append = False
-        if "size" in region and "start" in region:
-            append = True
-        if "end" in region and "start" in region:
-            append = True
-        if append:
+        region = match_up_region(name, data, symbol_table)
+        if region is not None:
             ret.append(region)
     return ret
 
 
+def match_up_region(name, data, symbol_table):
+    if "start" not in data or ("size" not in data and "end" not in data):
+        return None
+    region = {}
+    for key in ["size", "start", "end"]:
+        sym = data.get(key)
+        if sym is not None and sym in symbol_table:
+            region[key] = {"sym": sym, "val": symbol_table[sym]}
+    if "start" not in region:
+        return None
+    if "size" not in region and "end" not in region:
+        return None
+    region["section"] = name
+    return region
+
+
 def get_region_range(region):
     ret = {}
     if "end" in region:
@@ -481,6 +846,65 @@ def symbols_from_file(sym_file):
             return [s.strip() for s in f.readlines()]
 
 
+def parse_and_match(script, object_file, needed, symbol_table=None):
+    script_data = get_linker_script_data(script)
+    if symbol_table is None:
+        symbol_table = symbols_from(object_file, needed)
+    needed = set(needed)
+    symbol_table = {k:v for k, v in symbol_table.items() if k in needed}
+
+    regions = match_up_addresses(script_data, symbol_table)
+
+    info("symbol table %s" % json.dumps(symbol_table, indent=2))
+    info("script data %s" % json.dumps(script_data, indent=2))
+    info("regions %s" % json.dumps(regions, indent=2))
+
+    return json.dumps(final_json_output(regions, symbol_table), indent=2)
+
+
+def cached_output_path(cache_dir, script, object_file, needed):
+    # The cached output depends on the linker script, the object file,
+    # the symbols that we were asked about and this script itself.
+    if cache_dir is None:
+        return None
+    digest = hashlib.sha256()
+    for path in [script, object_file, os.path.abspath(__file__)]:
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        except IOError:
+            return None
+        digest.update(b"\0")
+    digest.update("\n".join(sorted(set(needed))).encode())
+    return os.path.join(cache_dir, digest.hexdigest() + ".json")
+
+
+def load_cached_output(cache_file):
+    if cache_file is None:
+        return None
+    try:
+        with open(cache_file) as f:
+            final = f.read()
+    except IOError:
+        return None
+    info("Using cached output %s", cache_file)
+    return final
+
+
+def store_cached_output(cache_file, final):
+    if cache_file is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(final)
+        os.replace(tmp, cache_file)
+    except (IOError, OSError) as e:
+        warning("Unable to write cache file %s: %s", cache_file, e)
+
+
 def main():
     pars = argparse.ArgumentParser(
         description="Generate info about linker-defined symbols and regions.",
@@ -497,8 +921,23 @@ def main():
     sym_source.add_argument("-i", "--sym-file",
             metavar="F", help="file of names of linker symbols")
 
+    pars.add_argument("-x", "--exclude", metavar="P", action="append",
+                      default=[], help="with --dir, skip directories "
+                      "whose name matches glob P; may be repeated")
+    pars.add_argument("-j", "--jobs", metavar="N", type=int, default=None,
+                      help="with --dir, scan with N processes "
+                      "(default: one per CPU)")
+    pars.add_argument("-c", "--scan-cache", metavar="F", default=None,
+                      help="with --dir, remember the extern declarations "
+                      "of each file in F between runs")
+
     pars.add_argument("-t", "--out-file", metavar="F",
                       help="default: stdout", default=None)
+    pars.add_argument("-C", "--cache-dir", metavar="D",
+                      default=os.environ.get("LS_PARSE_CACHE_DIR"),
+                      help="reuse output from earlier runs on the same "
+                      "script, object and symbols, storing it in D "
+                      "(default: $LS_PARSE_CACHE_DIR; no caching if unset)")
 
     verbs = pars.add_mutually_exclusive_group()
     verbs.add_argument("-v", "--verbose", action="store_true")
@@ -515,22 +954,23 @@ def main():
     form = "linkerscript parse %(levelname)s: %(message)s"
     logging.basicConfig(format=form, level=lvl)
 
-    script_data = get_linker_script_data(args.script)
-    symbol_table = symbols_from(args.object)
+    symbol_table = None
     if args.dir:
-        needed = needed_definitions(symbol_table.keys(), args.dir)
+        symbol_table = symbols_from(args.object)
+        needed = needed_definitions(symbol_table.keys(), args.dir,
+                                    args.exclude, args.jobs,
+                                    args.scan_cache)
     else:
         needed = symbols_from_file(args.sym_file)
-    symbol_table = {k:v for k, v in symbol_table.items() if k in needed}
 
-    regions = match_up_addresses(script_data, symbol_table)
-
-    info("symbol table %s" % json.dumps(symbol_table, indent=2))
-    info("script data %s" % json.dumps(script_data, indent=2))
-    info("regions %s" % json.dumps(regions, indent=2))
+    cache_file = cached_output_path(args.cache_dir, args.script,
+                                    args.object, needed)
+    final = load_cached_output(cache_file)
+    if final is None:
+        final = parse_and_match(args.script, args.object, needed,
+                                symbol_table)
+        store_cached_output(cache_file, final)
 
-    final = json.dumps(final_json_output(regions, symbol_table),
-                       indent=2)
     if args.out_file:
         with open(args.out_file, "w") as f:
             f.write(final)
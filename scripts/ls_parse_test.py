@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the linker script parsing of ls_parse.py. Run with
+
+    python3 -m unittest ls_parse_test
+
+from the scripts directory.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+import ls_parse
+
+
+def parse(script):
+    with tempfile.NamedTemporaryFile("w", suffix=".ld", delete=False) as f:
+        f.write(script)
+    try:
+        return ls_parse.get_linker_script_data(f.name)
+    finally:
+        os.remove(f.name)
+
+
+MEMORY = """
+MEMORY {
+  RAM : ORIGIN = 0x1000, LENGTH = 25M
+}
+"""
+
+
+class AssignExprTest(unittest.TestCase):
+    def test_origin_and_length_arithmetic(self):
+        state = parse(MEMORY + """
+SECTIONS {
+  _ram_start = ORIGIN(RAM);
+  _ram_end = ALIGN(ORIGIN(RAM) + LENGTH(RAM) - 0x10, 0x100);
+}
+""")
+        addrs = dict((a["sym"], a["addr"]) for a in state["expr-assigns"])
+        # ls_parse takes M to mean 10^6
+        end = 0x1000 + 25 * 1000 * 1000 - 0x10
+        self.assertEqual(addrs, {"_ram_start": 0x1000,
+                                 "_ram_end": (end + 0xff) // 0x100 * 0x100})
+
+    def test_plain_assignment_ends_section(self):
+        # An assignment not involving a memory block is not taken as an
+        # expression assignment, so _etext is not the end of .text.
+        state = parse(MEMORY + """
+SECTIONS {
+  .text : {
+    _stext = .;
+    *(.text*)
+    _etext = .;
+    _foo = 0x10;
+    _al = ALIGN(4);
+  } > RAM
+}
+""")
+        self.assertEqual(state["sections"][".text"], {"start": "_stext"})
+        self.assertEqual(state["expr-assigns"], [])
+
+    def test_long_number_without_semicolon(self):
+        start = time.time()
+        for expr in ["1" * 40, "ORIGIN(RAM) + " + "1" * 40]:
+            state = parse(MEMORY + "SECTIONS { x = %s }" % expr)
+            self.assertEqual(state["expr-assigns"], [])
+        self.assertLess(time.time() - start, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
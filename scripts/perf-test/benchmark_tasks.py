@@ -0,0 +1,64 @@
+import re
+
+
+# SV-COMP categories that a performance test can run
+ALL_TASKS = ['ConcurrencySafety-Main', 'DefinedBehavior-Arrays',
+             'DefinedBehavior-TerminCrafted', 'MemSafety-Arrays',
+             'MemSafety-Heap', 'MemSafety-LinkedLists',
+             'MemSafety-Other', 'MemSafety-TerminCrafted',
+             'Overflows-BitVectors', 'Overflows-Other',
+             'ReachSafety-Arrays', 'ReachSafety-BitVectors',
+             'ReachSafety-ControlFlow', 'ReachSafety-ECA',
+             'ReachSafety-Floats', 'ReachSafety-Heap',
+             'ReachSafety-Loops', 'ReachSafety-ProductLines',
+             'ReachSafety-Recursive', 'ReachSafety-Sequentialized',
+             'Systems_BusyBox_MemSafety', 'Systems_BusyBox_Overflows',
+             'Systems_DeviceDriversLinux64_ReachSafety',
+             'Termination-MainControlFlow', 'Termination-MainHeap',
+             'Termination-Other']
+
+QUICK_TASKS = ['ReachSafety-Loops', 'ReachSafety-BitVectors']
+
+# each task is run once with a release build and once with a profiling build
+CONFIGS = ['release', 'profiling']
+
+
+def select_tasks(task_set):
+    """
+    map the -T/--tasks argument (quick, full, or a regex) to categories
+    """
+    if task_set == 'full':
+        tasks = ALL_TASKS
+    elif task_set == 'quick':
+        tasks = QUICK_TASKS
+    else:
+        tasks = [t for t in ALL_TASKS if re.match('^' + task_set + '$', t)]
+        assert(tasks)
+    return tasks
+
+
+def make_jobs(tasks, configs=CONFIGS):
+    """
+    build the job names that workers consume: <config>-<task>
+    """
+    return [c + '-' + t for t in tasks for c in configs]
+
+
+def shard_job(job, shard, shards):
+    """
+    the job name of shard (counting from 1) of shards of job
+    """
+    return '{}.{}of{}'.format(job, shard, shards)
+
+
+def parse_job(job):
+    """
+    split a job name into its configuration, task, shard and number of
+    shards (1 of 1 for jobs covering a whole task)
+    """
+    cfg, task = job.split('-', 1)
+    assert(cfg in CONFIGS)
+    m = re.match(r'^(.*)\.([0-9]+)of([0-9]+)$', task)
+    if m:
+        return (cfg, m.group(1), int(m.group(2)), int(m.group(3)))
+    return (cfg, task, 1, 1)
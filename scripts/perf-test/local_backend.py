@@ -0,0 +1,512 @@
+"""
+Run performance tests on local machines instead of AWS.
+
+The stand-ins mirror the AWS set-up used by perf_test.py:
+
+- an artifact store rooted in a directory instead of the S3 bucket; keys
+  have the same <perf-test-id>/<config>/... layout as the bucket
+- a job queue of files in a directory instead of the SQS queues; claiming
+  a job renames it into running/, which is atomic, so the queue can also
+  be shared by workers on several hosts through a network file system
+- builds in a local clone of the repository instead of CodeBuild
+- a pool of worker processes instead of the EC2 fleet; each worker runs
+  the same steps as the user data script in ec2.yaml
+
+The benchmarking tools are expected in a directory laid out like the EBS
+volume built by ebs.yaml, i.e., containing benchexec, cprover-sv-comp and
+sv-benchmarks.
+"""
+
+import bz2
+import concurrent.futures
+import contextlib
+import glob
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+import urllib.request
+
+from benchmark_tasks import parse_job
+from shards import merge_shard_logs, split_tasks
+
+
+CBMC_XML_URL = ('https://raw.githubusercontent.com/sosy-lab/sv-comp/' +
+                'master/benchmark-defs/cbmc.xml')
+
+# resource limits per benchexec run, as used in ec2.yaml
+LIMITS = {
+    'release': {'time': '900s', 'memory': '15GB', 'memory_gb': 15},
+    'profiling': {'time': '600s', 'memory': '7GB', 'memory_gb': 7}
+}
+
+
+class LocalArtifactStore(object):
+    """
+    directory-backed replacement of the S3 bucket
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put_file(self, src, key):
+        dst = self.path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.tmp-' + str(os.getpid())
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+    def put_tree(self, src, key):
+        for root, _, files in os.walk(src):
+            for f in files:
+                path = os.path.join(root, f)
+                self.put_file(
+                        path,
+                        os.path.join(key, os.path.relpath(path, src)))
+
+    def get_file(self, key, dst):
+        shutil.copy2(self.path(key), dst)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+
+class LocalJobQueue(object):
+    """
+    directory-backed replacement of the SQS queue and its -run companion
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.dirs = {}
+        for state in ['pending', 'running', 'done', 'failed']:
+            self.dirs[state] = os.path.join(self.root, state)
+            os.makedirs(self.dirs[state], exist_ok=True)
+        self.seq = len(self.list('pending')) + len(self.list('running')) + \
+            len(self.list('done')) + len(self.list('failed'))
+
+    def list(self, state):
+        return sorted(os.listdir(self.dirs[state]))
+
+    def put(self, jobs):
+        """
+        enqueue jobs; they are handed out in the order they were put
+        """
+        for job in jobs:
+            name = '{:06d}-{}'.format(self.seq, job)
+            self.seq += 1
+            tmp = os.path.join(self.root, '.' + name)
+            with open(tmp, 'w') as f:
+                f.write(job)
+            os.replace(tmp, os.path.join(self.dirs['pending'], name))
+
+    def claim(self, worker):
+        """
+        take the oldest pending job, returning a claim or None if the queue
+        is empty
+        """
+        for name in self.list('pending'):
+            claim = name + '@' + worker
+            try:
+                os.rename(os.path.join(self.dirs['pending'], name),
+                          os.path.join(self.dirs['running'], claim))
+            except FileNotFoundError:
+                # another worker was faster
+                continue
+            return claim
+        return None
+
+    def seal(self):
+        """
+        record that all jobs have been put; until then, workers wait for
+        more jobs when the queue is empty
+        """
+        open(os.path.join(self.root, 'sealed'), 'w').close()
+
+    def sealed(self):
+        return os.path.exists(os.path.join(self.root, 'sealed'))
+
+    def job(self, claim):
+        return claim.split('@')[0].split('-', 1)[1]
+
+    def finish(self, claim, success):
+        os.rename(os.path.join(self.dirs['running'], claim),
+                  os.path.join(self.dirs['done' if success else 'failed'],
+                               claim))
+
+
+def run_logged(cmd, log, **kwargs):
+    log.write('+ ' + ' '.join(cmd) + '\n')
+    log.flush()
+    subprocess.check_call(cmd, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+
+
+def physical_memory_gb():
+    return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')) >> 30
+
+
+class LocalBackend(object):
+    """
+    runs the stages of a performance test on this host
+    """
+    def __init__(self, args, perf_test_id):
+        self.logger = logging.getLogger('perf_test')
+        self.args = args
+        self.perf_test_id = perf_test_id
+        self.root = os.path.abspath(args.local_dir)
+        self.bench_root = os.path.abspath(args.bench_root)
+        self.store = LocalArtifactStore(os.path.join(self.root, 'artifacts'))
+        self.queue = LocalJobQueue(
+                os.path.join(self.root, 'queues', perf_test_id))
+        self.procs = []
+
+    def setup(self):
+        assert(not self.args.witness_check)
+        for d in ['benchexec', 'cprover-sv-comp', 'sv-benchmarks']:
+            assert(os.path.isdir(os.path.join(self.bench_root, d)))
+        os.makedirs(self.root, exist_ok=True)
+
+    def prepare_store(self):
+        os.makedirs(self.store.path(self.perf_test_id), exist_ok=True)
+        self.logger.info('local: artifact store {} set up'.format(
+            self.store.path(self.perf_test_id)))
+
+    def prepare_workers(self):
+        # the benchmark definition is fetched once and shared by all
+        # workers
+        cbmc_xml = os.path.join(self.bench_root, 'cbmc.xml')
+        if not os.path.isfile(cbmc_xml):
+            urllib.request.urlretrieve(CBMC_XML_URL, cbmc_xml)
+        self.logger.info('local: benchmarking tools in {} ready'.format(
+            self.bench_root))
+
+    def prepare_queue(self):
+        self.logger.info('local: job queue {} set up'.format(
+            self.queue.root))
+
+    def seed(self, jobs):
+        self.queue.put(jobs)
+        self.logger.info('local: job queue seeded with {} jobs'.format(
+            len(jobs)))
+
+    def seal(self):
+        self.queue.seal()
+        self.logger.info('local: All jobs seeded')
+
+    def build(self, configs, on_built):
+        with concurrent.futures.ThreadPoolExecutor(len(configs)) as e:
+            futures = {e.submit(self.build_config, c): c for c in configs}
+            for f in concurrent.futures.as_completed(futures):
+                f.result()
+                on_built(futures[f])
+
+    def build_config(self, cfg):
+        # the same steps as the CodeBuild projects in codebuild.yaml
+        build_dir = os.path.join(self.root, 'builds', self.perf_test_id, cfg)
+        jobs = str(max(1, multiprocessing.cpu_count() // 2))
+        make_flags = []
+        if cfg == 'profiling':
+            make_flags = ['CXXFLAGS=-O2 -pg -g -finline-limit=4',
+                          'LINKFLAGS=-pg']
+        log_name = os.path.join(build_dir + '.log')
+        os.makedirs(os.path.dirname(build_dir), exist_ok=True)
+        self.logger.info('local: building {} in {}'.format(cfg, build_dir))
+        with open(log_name, 'w') as log:
+            if not os.path.isdir(build_dir):
+                run_logged(['git', 'clone', self.args.repository, build_dir],
+                           log)
+            run_logged(['git', 'checkout', self.args.commit_id], log,
+                       cwd=build_dir)
+            with open(os.path.join(build_dir, 'COMMIT_INFO'), 'w') as ci:
+                ci.write(self.args.repository + '\n')
+                ci.flush()
+                subprocess.check_call(['git', 'rev-parse', '--short', 'HEAD'],
+                                      stdout=ci, cwd=build_dir)
+                subprocess.check_call(['git', 'log', 'HEAD^..HEAD'],
+                                      stdout=ci, cwd=build_dir)
+            run_logged(['make', '-C', 'src', 'minisat2-download',
+                        'glucose-download', 'cadical-download'], log,
+                       cwd=build_dir)
+            run_logged(['make', '-C', 'src', '-j' + jobs] + make_flags, log,
+                       cwd=build_dir)
+
+        prefix = self.perf_test_id + '/' + cfg + '/'
+        self.store.put_file(os.path.join(build_dir, 'src/cbmc/cbmc'),
+                            prefix + 'cbmc')
+        self.store.put_file(os.path.join(build_dir, 'src/goto-cc/goto-cc'),
+                            prefix + 'goto-cc')
+        self.store.put_file(os.path.join(build_dir, 'COMMIT_INFO'),
+                            prefix + 'COMMIT_INFO')
+        self.store.put_file(log_name, prefix + 'build.log')
+        self.logger.info('local: Build {} ended: SUCCEEDED'.format(cfg))
+
+    def runtimes(self):
+        """
+        (job, perf test id, seconds) records of previous performance tests,
+        as recorded by the workers under runtimes/<job>/<perf test id>
+        """
+        records = []
+        root = self.store.path('runtimes')
+        for job in os.listdir(root) if os.path.isdir(root) else []:
+            for perf_test_id in os.listdir(os.path.join(root, job)):
+                with open(os.path.join(root, job, perf_test_id)) as f:
+                    records.append((job, perf_test_id, int(f.read())))
+        return records
+
+    def start_workers(self):
+        workers = self.args.parallel
+        cpus = max(1, multiprocessing.cpu_count() // workers)
+        memory_gb = max(1, physical_memory_gb() // workers)
+        for n in range(workers):
+            name = 'local{}'.format(n)
+            p = multiprocessing.Process(
+                    target=worker_loop,
+                    args=(name, self.store.root, self.queue.root,
+                          self.bench_root, self.perf_test_id, cpus,
+                          memory_gb))
+            p.start()
+            self.logger.info('local: Running benchmarks on ' + name)
+            self.procs.append(p)
+
+    def wait(self):
+        """
+        wait until the workers have drained the queue
+        """
+        for p in self.procs:
+            p.join()
+        failed = self.queue.list('failed')
+        # jobs of a worker that died are never finished
+        running = self.queue.list('running')
+        self.logger.info('local: {} jobs done, {} failed'.format(
+            len(self.queue.list('done')), len(failed)))
+        for claim in failed:
+            self.logger.warning('local: job {} failed'.format(claim))
+        for claim in running:
+            self.logger.warning('local: job {} not finished'.format(claim))
+        crashed = [p for p in self.procs if p.exitcode != 0]
+        for p in crashed:
+            self.logger.warning('local: worker {} exited with {}'.format(
+                p.pid, p.exitcode))
+        return 1 if failed or running or crashed else 0
+
+
+def worker_loop(name, store_root, queue_root, bench_root, perf_test_id, cpus,
+                memory_gb):
+    """
+    the local equivalent of the job loop in ec2.yaml's user data
+    """
+    logger = logging.getLogger('perf_test')
+    store = LocalArtifactStore(store_root)
+    queue = LocalJobQueue(queue_root)
+    work_dir = os.path.join(bench_root, 'run-' + name)
+    # each worker packages the tool in its own copy of cprover-sv-comp
+    sv_comp = os.path.join(bench_root, 'work-' + name, 'cprover-sv-comp')
+    if not os.path.isdir(sv_comp):
+        shutil.copytree(os.path.join(bench_root, 'cprover-sv-comp'), sv_comp,
+                        symlinks=True)
+
+    delay = 1
+    while True:
+        claim = queue.claim(name)
+        if claim is None:
+            # check for sealing before the queue is found empty, as jobs may
+            # be put in between
+            if queue.sealed() and not queue.list('pending'):
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+            continue
+        delay = 1
+        job = queue.job(claim)
+        logger.info('{}: Task: {}'.format(name, job))
+        log_key = '{}/{}.{}.log'.format(perf_test_id, name, job)
+        start = time.time()
+        with tempfile.NamedTemporaryFile('w', delete=False) as log:
+            try:
+                run_job(job, store, bench_root, sv_comp, work_dir,
+                        perf_test_id, cpus, memory_gb, log)
+                success = True
+            except Exception:
+                # any error fails the job rather than the worker, which
+                # would leave the job claimed forever
+                log.write('failed: {}\n'.format(traceback.format_exc()))
+                success = False
+        if success:
+            record_runtime(store, job, perf_test_id, int(time.time() - start))
+        store.put_file(log.name, log_key)
+        os.remove(log.name)
+        queue.finish(claim, success)
+
+
+def record_runtime(store, job, perf_test_id, seconds):
+    with tempfile.NamedTemporaryFile('w', delete=False) as f:
+        f.write(str(seconds))
+    store.put_file(f.name, 'runtimes/{}/{}'.format(job, perf_test_id))
+    os.remove(f.name)
+
+
+def run_job(job, store, bench_root, sv_comp, work_dir, perf_test_id, cpus,
+            memory_gb, log):
+    cfg, t, shard, shards = parse_job(job)
+    prefix = perf_test_id + '/' + cfg + '/'
+    suffix = '.{}of{}'.format(shard, shards) if shards > 1 else ''
+
+    # package the tool
+    for tool in ['cbmc', 'goto-cc']:
+        dst = os.path.join(sv_comp, 'src', tool, tool)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        store.get_file(prefix + tool, dst)
+        os.chmod(dst, 0o755)
+    open(os.path.join(sv_comp, 'LICENSE'), 'a').close()
+    zip_file = os.path.join(sv_comp, 'cbmc.zip')
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(zip_file)
+    run_logged(['make', 'CBMC=.', 'cbmc.zip'], log, cwd=sv_comp)
+
+    # the benchmark definition refers to ../sv-benchmarks, hence work_dir
+    # is a sibling of it
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    run_logged(['unzip', zip_file], log, cwd=work_dir)
+    for f in os.listdir(os.path.join(work_dir, 'cbmc')):
+        os.rename(os.path.join(work_dir, 'cbmc', f), os.path.join(work_dir, f))
+    os.rmdir(os.path.join(work_dir, 'cbmc'))
+    with open(os.path.join(bench_root, 'cbmc.xml')) as f:
+        cbmc_xml = f.read().replace(
+                'witness.graphml',
+                '${logfile_path_abs}${inputfile_name}-witness.graphml')
+    with open(os.path.join(work_dir, 'cbmc.xml'), 'w') as f:
+        f.write(cbmc_xml)
+    os.makedirs(os.path.join(work_dir, 'tmp'))
+
+    if shards == 1 or split_tasks(
+            os.path.join(work_dir, 'cbmc.xml'), t, shard, shards):
+        run_benchexec(cfg, t, suffix, store, prefix, bench_root, work_dir,
+                      perf_test_id, cpus, memory_gb, log)
+    else:
+        log.write('Shard {} of {} is empty\n'.format(suffix[1:], t))
+
+    if shards > 1:
+        # the worker completing the last shard merges the results of all of
+        # them
+        marker = work_dir + '.shard'
+        open(marker, 'w').close()
+        store.put_file(marker, '{}shards-{}/{}'.format(prefix, t, suffix[1:]))
+        os.remove(marker)
+        if len(os.listdir(store.path(prefix + 'shards-' + t))) == shards:
+            merge_shards(cfg, t, store, prefix, bench_root, work_dir, log)
+
+
+def run_benchexec(cfg, t, suffix, store, prefix, bench_root, work_dir,
+                  perf_test_id, cpus, memory_gb, log):
+    limits = LIMITS[cfg]
+    max_par = str(max(1, min(cpus, memory_gb // limits['memory_gb'])))
+    benchexec = os.path.join(bench_root, 'benchexec', 'bin', 'benchexec')
+    logs = 'logs-' + t + suffix
+    env = dict(os.environ, TMPDIR=os.path.join(work_dir, 'tmp'))
+    run_logged([benchexec, 'cbmc.xml', '--no-container', '--task', t,
+                '-T', limits['time'], '-M', limits['memory'],
+                '-o', logs + '/', '-N', max_par, '-c', '1'], log,
+               cwd=work_dir, env=env)
+
+    if cfg == 'profiling':
+        store_profiles(store, prefix, t, suffix, work_dir, log)
+        return
+
+    logs_dir = os.path.join(work_dir, logs)
+    logfiles = glob.glob(os.path.join(logs_dir, 'cbmc.*.logfiles'))
+    if logfiles:
+        run_logged(['tar', 'czf', 'witnesses.tar.gz'] +
+                   [os.path.basename(l) for l in logfiles], log, cwd=logs_dir)
+        for l in logfiles:
+            shutil.rmtree(l)
+    for result in glob.glob(os.path.join(logs_dir, '*.xml.bz2')):
+        tag_result(result, perf_test_id)
+    table_generator = os.path.join(bench_root, 'benchexec', 'bin',
+                                   'table-generator')
+    run_logged([table_generator] +
+               glob.glob(os.path.join(logs_dir, '*.xml.bz2')) +
+               ['-o', logs_dir], log, cwd=work_dir)
+    store.put_tree(logs_dir, prefix + logs)
+
+
+def merge_shards(cfg, t, store, prefix, bench_root, work_dir, log):
+    if cfg == 'profiling':
+        # sum up the profiles of the shards, using this shard's binaries
+        for tool, binary, name in PROFILES:
+            sums = glob.glob(store.path(
+                '{}gmon-{}-{}.*of*'.format(prefix, tool, t)))
+            if not sums:
+                continue
+            run_logged(['gprof', '--sum', binary] + sums, log, cwd=work_dir)
+            write_profile(store, prefix, name + t, binary, work_dir, log)
+        return
+
+    shard_dirs = glob.glob(store.path('{}logs-{}.*of*'.format(prefix, t)))
+    if not any(glob.glob(os.path.join(d, '*.xml.bz2')) for d in shard_dirs):
+        return
+    logs_dir = os.path.join(work_dir, 'logs-' + t)
+    merge_shard_logs(shard_dirs, logs_dir)
+    table_generator = os.path.join(bench_root, 'benchexec', 'bin',
+                                   'table-generator')
+    run_logged([table_generator] +
+               glob.glob(os.path.join(logs_dir, '*.xml.bz2')) +
+               ['-o', logs_dir], log, cwd=work_dir)
+    store.put_tree(logs_dir, prefix + 'logs-' + t)
+
+
+def tag_result(result, perf_test_id):
+    """
+    mark a benchexec result with the performance test it belongs to, as
+    ec2.yaml does
+    """
+    with bz2.open(result, 'rt') as f:
+        xml = f.read()
+    start_date = '{} {}'.format(
+            '-'.join(perf_test_id.split('-')[0:3]),
+            ':'.join(perf_test_id.split('-')[3:6]))
+    xml = re.sub(r'^(<result.*version="[^"]*)',
+                 lambda m: m.group(1) + ':' + perf_test_id, xml,
+                 flags=re.MULTILINE)
+    xml = re.sub(r'^(<result.*date=)"[^"]*',
+                 lambda m: m.group(1) + '"' + start_date, xml,
+                 flags=re.MULTILINE)
+    with bz2.open(result, 'wt') as f:
+        f.write(xml)
+
+
+# the profiled tools, the binaries that gprof needs and the names of the
+# profiles
+PROFILES = [('cbmc', './cbmc-binary', 'sum.profile-'),
+            ('goto-cc', './goto-cc', 'sum.goto-cc-profile-')]
+
+
+def store_profiles(store, prefix, t, suffix, work_dir, log):
+    # combine the gprof output of all runs, as ec2.yaml does; the sums of
+    # shards are kept for merge_shards
+    for tool, binary, name in PROFILES:
+        outs = glob.glob(os.path.join(work_dir, tool + '*.gmon.out.*'))
+        if not outs:
+            continue
+        run_logged(['gprof', '--sum', binary] +
+                   [os.path.basename(o) for o in outs], log, cwd=work_dir)
+        if suffix:
+            store.put_file(os.path.join(work_dir, 'gmon.sum'),
+                           '{}gmon-{}-{}{}'.format(prefix, tool, t, suffix))
+            os.remove(os.path.join(work_dir, 'gmon.sum'))
+        else:
+            write_profile(store, prefix, name + t, binary, work_dir, log)
+
+
+def write_profile(store, prefix, name, binary, work_dir, log):
+    with open(os.path.join(work_dir, name), 'w') as out:
+        subprocess.check_call(['gprof', binary, 'gmon.sum'], stdout=out,
+                              stderr=log, cwd=work_dir)
+    store.put_file(os.path.join(work_dir, name), prefix + name)
+    os.remove(os.path.join(work_dir, 'gmon.sum'))
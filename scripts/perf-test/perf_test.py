@@ -3,31 +3,27 @@
 from __future__ import print_function
 
 import argparse
-import boto3
 import concurrent.futures
-import contextlib
 import datetime
-import json
 import logging
 import os
 import re
-import shutil
 import sys
-import tempfile
+import threading
 import time
-import urllib
 
+from benchmark_tasks import CONFIGS, make_jobs, parse_job, select_tasks, \
+    shard_job
+from prices import AwsPriceSource, FixturePriceSource, PriceCache
+from scheduling import HISTORY_DEPTH, choose_fleet_size, \
+    estimate_runtimes, longest_first, plan_shards, runtime_history
 
-@contextlib.contextmanager
-def make_temp_directory():
-    """
-    create a temporary directory and remove it once the statement completes
-    """
-    temp_dir = tempfile.mkdtemp()
-    try:
-        yield temp_dir
-    finally:
-        shutil.rmtree(temp_dir)
+try:
+    import boto3
+    import botocore.exceptions
+except ImportError:
+    # only required for the AWS backend
+    boto3 = None
 
 
 def same_dir(filename):
@@ -35,6 +31,89 @@ def same_dir(filename):
     return os.path.join(d, filename)
 
 
+def poll(check, initial=2, maximum=30):
+    """
+    call check until it returns something other than None, sleeping for
+    exponentially growing periods (capped at maximum seconds) in between
+    """
+    delay = initial
+    while True:
+        result = check()
+        if result is not None:
+            return result
+        time.sleep(delay)
+        delay = min(delay * 2, maximum)
+
+
+def wait_for_stack(cfn, stack_name, operation='CREATE'):
+    """
+    wait for a CloudFormation stack operation (CREATE or DELETE) to
+    complete; unlike boto3's waiters this starts with short delays, as small
+    stacks complete within seconds
+    """
+    logger = logging.getLogger('perf_test')
+
+    def check():
+        try:
+            res = cfn.meta.client.describe_stacks(StackName=stack_name)
+        except botocore.exceptions.ClientError:
+            # deleted stacks can no longer be described by name
+            assert(operation == 'DELETE')
+            return True
+        status = res['Stacks'][0]['StackStatus']
+        if status == operation + '_IN_PROGRESS':
+            return None
+        if status != operation + '_COMPLETE':
+            logger.error('Stack {} failed: {}'.format(stack_name, status))
+            assert(False)
+        return True
+
+    poll(check)
+    return cfn.Stack(stack_name)
+
+
+def when_done(executor, prerequisites, fn, *args):
+    """
+    submit fn(*args) to executor as soon as all prerequisite futures have
+    completed successfully; the returned future fails as soon as one of the
+    prerequisites fails
+    """
+    result = concurrent.futures.Future()
+    remaining = [len(prerequisites)]
+    lock = threading.Lock()
+
+    def forward(f):
+        if f.exception():
+            result.set_exception(f.exception())
+        else:
+            result.set_result(f.result())
+
+    def prerequisite_done(f):
+        with lock:
+            if result.done() or remaining[0] == 0:
+                return
+            if f.exception():
+                result.set_exception(f.exception())
+                return
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        submit()
+
+    def submit():
+        try:
+            executor.submit(fn, *args).add_done_callback(forward)
+        except RuntimeError as e:
+            # the executor has been shut down as some other stage failed
+            result.set_exception(e)
+
+    if not prerequisites:
+        submit()
+    for p in prerequisites:
+        p.add_done_callback(prerequisite_done)
+    return result
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-r', '--repository', type=str, required=True,
@@ -42,8 +121,21 @@ def parse_args():
                              'code to evaluate')
     parser.add_argument('-c', '--commit-id', type=str, required=True,
                         help='git revision to evaluate')
-    parser.add_argument('-e', '--email', type=str, required=True,
-                        help='Email address to notify about results')
+    parser.add_argument('-e', '--email', type=str,
+                        help='Email address to notify about results ' +
+                             '(required for the AWS backend)')
+    parser.add_argument('-b', '--backend', choices=['aws', 'local'],
+                        default='aws',
+                        help='Run on AWS or on this host (default: aws)')
+    parser.add_argument('--local-dir', type=str,
+                        default='perf-test-local',
+                        help='Directory holding artifacts, job queues and ' +
+                             'builds of the local backend ' +
+                             '(default: perf-test-local)')
+    parser.add_argument('--bench-root', type=str, default='/mnt',
+                        help='Directory containing benchexec, ' +
+                             'cprover-sv-comp and sv-benchmarks for the ' +
+                             'local backend (default: /mnt)')
     parser.add_argument('-t', '--instance-type', type=str,
                         default='r4.16xlarge',
                         help='Amazon EC2 instance type to use ' +
@@ -55,9 +147,29 @@ def parse_args():
                              '(default: Amazon EC2 Spot fleet)')
     parser.add_argument('-R', '--region', type=str,
                         help='Set fixed region instead of cheapest fleet')
-    parser.add_argument('-j', '--parallel', type=int, default=4,
-                        help='Fleet size of concurrently running hosts ' +
-                             '(default: 4)')
+    parser.add_argument('--price-cache', type=str,
+                        default=os.path.join(
+                            os.path.expanduser('~'), '.cache', 'perf-test'),
+                        help='Directory to cache instance prices in ' +
+                             '(default: ~/.cache/perf-test)')
+    parser.add_argument('--price-cache-ttl', type=int, default=3600,
+                        help='Seconds for which cached prices are used; ' +
+                             '0 disables the cache (default: 3600)')
+    parser.add_argument('--price-fixture', type=str,
+                        help='Read prices from a JSON file instead of ' +
+                             'querying AWS (see prices.py)')
+    parser.add_argument('-j', '--parallel', type=int,
+                        help='Fleet size of concurrently running hosts, ' +
+                             'or number of worker processes of the local ' +
+                             'backend (default: chosen from the runtimes ' +
+                             'of previous runs)')
+    parser.add_argument('--max-parallel', type=int, default=16,
+                        help='Upper bound of the automatically chosen ' +
+                             'fleet size (default: 16)')
+    parser.add_argument('--max-shards', type=int, default=16,
+                        help='Maximum number of jobs a task is split into ' +
+                             'to balance load across hosts; 1 disables ' +
+                             'splitting (default: 16)')
     parser.add_argument('-k', '--ssh-key-name', type=str, default='',
                         help='EC2 key name for SSH access to fleet')
     parser.add_argument('-K', '--ssh-key', type=str,
@@ -75,8 +187,17 @@ def parse_args():
 
     args = parser.parse_args()
 
-    assert(args.repository.startswith('https://github.com/') or
-           args.repository.startswith('https://git-codecommit.'))
+    assert(args.parallel is None or args.parallel > 0)
+    assert(args.max_parallel > 0)
+    assert(args.max_shards > 0)
+    if args.backend == 'aws':
+        assert(boto3)
+        assert(args.email)
+        assert(args.repository.startswith('https://github.com/') or
+               args.repository.startswith('https://git-codecommit.'))
+    else:
+        # there is no witness checking set-up outside ec2.yaml
+        assert(not args.witness_check)
     assert(not args.ssh_key or args.ssh_key_name)
     if args.ssh_key:
         assert(os.path.isfile(args.ssh_key))
@@ -113,8 +234,7 @@ def prepare_s3(session, bucket_name, artifact_uploaded_arn):
             }
         ])
 
-    waiter = cfn.meta.client.get_waiter('stack_create_complete')
-    waiter.wait(StackName='perf-test-s3', WaiterConfig={'Delay': 10})
+    wait_for_stack(cfn, 'perf-test-s3')
     logger.info('us-east-1: S3 bucket {} set up'.format(bucket_name))
 
 
@@ -176,19 +296,12 @@ def prepare_sns_s3(session, email, bucket_name):
                     }
                 ])
 
-    waiter = cfn.meta.client.get_waiter('stack_create_complete')
     if not instance_terminated_arn:
-        waiter.wait(
-                StackName='perf-test-sns-instance-term',
-                WaiterConfig={'Delay': 10})
-        stack = cfn.Stack('perf-test-sns-instance-term')
+        stack = wait_for_stack(cfn, 'perf-test-sns-instance-term')
         instance_terminated_arn = stack.outputs[0]['OutputValue']
         logger.info('us-east-1: SNS topic instance_terminated set up')
     if not artifact_uploaded_arn:
-        waiter.wait(
-                StackName='perf-test-sns-artifact-uploaded',
-                WaiterConfig={'Delay': 10})
-        stack = cfn.Stack('perf-test-sns-artifact-uploaded')
+        stack = wait_for_stack(cfn, 'perf-test-sns-artifact-uploaded')
         artifact_uploaded_arn = stack.outputs[0]['OutputValue']
         logger.info('us-east-1: SNS topic artifact_uploaded set up')
 
@@ -197,72 +310,49 @@ def prepare_sns_s3(session, email, bucket_name):
     return instance_terminated_arn
 
 
-def select_region(session, mode, region, instance_type):
+def select_region(prices, mode, region, instance_type):
     # find the region and az with the lowest spot price for the chosen instance
     # type
     # based on https://gist.github.com/pahud/fbbc1fd80fac4544fd0a3a480602404e
     logger = logging.getLogger('perf_test')
 
     if not region:
-        ec2 = session.client('ec2')
-        regions = [r['RegionName'] for r in ec2.describe_regions()['Regions']]
+        regions = prices.regions()
     else:
         regions = [region]
 
+    # query all regions at once, each of them takes a few round trips
+    with concurrent.futures.ThreadPoolExecutor(len(regions)) as e:
+        if mode == 'on-demand':
+            logger.info('global: Fetching on-demand prices for ' +
+                        instance_type)
+            offers = e.map(
+                    lambda r: [(None, prices.on_demand_price(
+                        r, instance_type))],
+                    regions)
+        else:
+            logger.info('global: Fetching spot prices for ' + instance_type)
+            offers = e.map(
+                    lambda r: prices.spot_prices(r, instance_type),
+                    regions)
+        offers = list(offers)
+
     min_region = None
     min_az = None
     min_price = None
 
-    if mode == 'on-demand':
-        logger.info('global: Fetching on-demand prices for ' + instance_type)
-        with make_temp_directory() as tmp_dir:
-            for r in regions:
-                json_file = os.path.join(tmp_dir, 'index.json')
-                urllib.request.urlretrieve(
-                        'https://pricing.us-east-1.amazonaws.com/offers/' +
-                        'v1.0/aws/AmazonEC2/current/' + r + '/index.json',
-                        json_file)
-                with open(json_file) as jf:
-                    json_result = json.load(jf)
-                key = None
-                for p in json_result['products']:
-                    v = json_result['products'][p]
-                    a = v['attributes']
-                    if ((v['productFamily'] == 'Compute Instance') and
-                            (a['instanceType'] == instance_type) and
-                            (a['tenancy'] == 'Shared') and
-                            (a['operatingSystem'] == 'Linux')):
-                        assert(not key)
-                        key = p
-                for c in json_result['terms']['OnDemand'][key]:
-                    v = json_result['terms']['OnDemand'][key][c]
-                    for p in v['priceDimensions']:
-                        price = v['priceDimensions'][p]['pricePerUnit']['USD']
-                if min_region is None or float(price) < min_price:
-                    min_region = r
-                    ec2 = session.client('ec2', region_name=r)
-                    azs = ec2.describe_availability_zones(
-                            Filters=[{'Name': 'region-name', 'Values': [r]}])
-                    min_az = azs['AvailabilityZones'][0]['ZoneName']
-                    min_price = float(price)
+    for r, region_offers in zip(regions, offers):
+        for az, price in region_offers:
+            if min_region is None or price < min_price:
+                min_region = r
+                min_az = az
+                min_price = price
 
+    if mode == 'on-demand':
+        min_az = prices.availability_zones(min_region)[0]
         logger.info('global: Lowest on-demand price: {} ({}): {}'.format(
             min_region, min_az, min_price))
     else:
-        logger.info('global: Fetching spot prices for ' + instance_type)
-        for r in regions:
-            ec2 = session.client('ec2', region_name=r)
-            res = ec2.describe_spot_price_history(
-                    InstanceTypes=[instance_type],
-                    ProductDescriptions=['Linux/UNIX'],
-                    StartTime=datetime.datetime.now())
-            history = res['SpotPriceHistory']
-            for az in history:
-                if min_region is None or float(az['SpotPrice']) < min_price:
-                    min_region = r
-                    min_az = az['AvailabilityZone']
-                    min_price = float(az['SpotPrice'])
-
         logger.info('global: Lowest spot price: {} ({}): {}'.format(
             min_region, min_az, min_price))
 
@@ -329,16 +419,20 @@ def prepare_ebs(session, region, az, ami):
                     }
                 ])
 
-        waiter = cfn.meta.client.get_waiter('stack_create_complete')
-        waiter.wait(StackName='perf-test-build-ebs')
+        stack = wait_for_stack(cfn, 'perf-test-build-ebs')
         instance_id = stack.outputs[0]['OutputValue']
         logger.info(region + ': Waiting for EBS snapshot preparation on ' +
                     instance_id)
-        waiter = ec2.get_waiter('instance_stopped')
-        waiter.wait(InstanceIds=[instance_id])
+
+        def instance_stopped():
+            res = ec2.describe_instances(InstanceIds=[instance_id])
+            state = res['Reservations'][0]['Instances'][0]['State']['Name']
+            return True if state == 'stopped' else None
+
+        # preparing the snapshot takes the better part of an hour
+        poll(instance_stopped, initial=60, maximum=60)
         stack.delete()
-        waiter = cfn.meta.client.get_waiter('stack_delete_complete')
-        waiter.wait(StackName='perf-test-build-ebs')
+        wait_for_stack(cfn, 'perf-test-build-ebs', 'DELETE')
         logger.info(region + ': EBS snapshot prepared')
 
         snapshots = ec2.describe_snapshots(
@@ -354,8 +448,9 @@ def prepare_ebs(session, region, az, ami):
 
 
 def build(session, repository, commit_id, bucket_name, perf_test_id,
-        codebuild_file):
-    # build the chosen commit in CodeBuild
+        codebuild_file, on_built):
+    # build the chosen commit in CodeBuild; on_built is called with the
+    # configuration as soon as either build has succeeded
     logger = logging.getLogger('perf_test')
 
     if repository.startswith('https://github.com/'):
@@ -390,8 +485,7 @@ def build(session, repository, commit_id, bucket_name, perf_test_id,
             ],
             Capabilities=['CAPABILITY_NAMED_IAM'])
 
-    waiter = cfn.meta.client.get_waiter('stack_create_complete')
-    waiter.wait(StackName=stack_name)
+    wait_for_stack(cfn, stack_name)
     logger.info('us-east-1: CodeBuild configuration complete')
 
     codebuild = session.client('codebuild', region_name='us-east-1')
@@ -403,29 +497,27 @@ def build(session, repository, commit_id, bucket_name, perf_test_id,
             sourceVersion=commit_id)['build']['id']
 
     logger.info('us-east-1: Waiting for builds to complete')
-    all_complete = False
-    completed = {}
-    while not all_complete:
-        time.sleep(10)
-        response = codebuild.batch_get_builds(ids=[rel_build, prof_build])
-        all_complete = True
+    pending = {rel_build: 'release', prof_build: 'profiling'}
+
+    def check():
+        response = codebuild.batch_get_builds(ids=list(pending))
         for b in response['builds']:
             if b['buildStatus'] == 'IN_PROGRESS':
-                all_complete = False
-                break
-            elif not completed.get(b['projectName']):
-                logger.info('us-east-1: Build {} ended: {}'.format(
-                    b['projectName'], b['buildStatus']))
-                assert(b['buildStatus'] == 'SUCCEEDED')
-                completed[b['projectName']] = True
+                continue
+            logger.info('us-east-1: Build {} ended: {}'.format(
+                b['projectName'], b['buildStatus']))
+            assert(b['buildStatus'] == 'SUCCEEDED')
+            on_built(pending.pop(b['id']))
+        return None if pending else True
+
+    poll(check, initial=10)
 
     stack.delete()
-    waiter = cfn.meta.client.get_waiter('stack_delete_complete')
-    waiter.wait(StackName=stack_name)
+    wait_for_stack(cfn, stack_name, 'DELETE')
     logger.info('us-east-1: CodeBuild complete and stack cleaned')
 
 
-def prepare_sqs(session, region, perf_test_id, tasks):
+def prepare_sqs(session, region, perf_test_id):
     # create a bucket for storing artifacts
     logger = logging.getLogger('perf_test')
 
@@ -443,8 +535,7 @@ def prepare_sqs(session, region, perf_test_id, tasks):
                 }
             ])
 
-    waiter = cfn.meta.client.get_waiter('stack_create_complete')
-    waiter.wait(StackName=stack_name, WaiterConfig={'Delay': 10})
+    stack = wait_for_stack(cfn, stack_name)
     for o in stack.outputs:
         if o['OutputKey'] == 'QueueArn':
             arn = o['OutputValue']
@@ -457,50 +548,27 @@ def prepare_sqs(session, region, perf_test_id, tasks):
     logger.info(region + ': SQS queues {}, {}-run set up'.format(
         queue, queue))
 
-    seed_queue(session, region, queue, tasks)
-
     return (queue, arn, url)
 
 
-def seed_queue(session, region, queue, task_set):
+def seed_queue(session, region, queue, jobs):
     # set up the tasks
     logger = logging.getLogger('perf_test')
 
-    all_tasks = ['ConcurrencySafety-Main', 'DefinedBehavior-Arrays',
-                 'DefinedBehavior-TerminCrafted', 'MemSafety-Arrays',
-                 'MemSafety-Heap', 'MemSafety-LinkedLists',
-                 'MemSafety-Other', 'MemSafety-TerminCrafted',
-                 'Overflows-BitVectors', 'Overflows-Other',
-                 'ReachSafety-Arrays', 'ReachSafety-BitVectors',
-                 'ReachSafety-ControlFlow', 'ReachSafety-ECA',
-                 'ReachSafety-Floats', 'ReachSafety-Heap',
-                 'ReachSafety-Loops', 'ReachSafety-ProductLines',
-                 'ReachSafety-Recursive', 'ReachSafety-Sequentialized',
-                 'Systems_BusyBox_MemSafety', 'Systems_BusyBox_Overflows',
-                 'Systems_DeviceDriversLinux64_ReachSafety',
-                 'Termination-MainControlFlow', 'Termination-MainHeap',
-                 'Termination-Other']
-
     sqs = session.resource('sqs', region_name=region)
     queue = sqs.get_queue_by_name(QueueName=queue)
-    if task_set == 'full':
-        tasks = all_tasks
-    elif task_set == 'quick':
-        tasks = ['ReachSafety-Loops', 'ReachSafety-BitVectors']
-    else:
-        tasks = [t for t in all_tasks if re.match('^' + task_set + '$', t)]
-        assert(tasks)
 
-    for t in tasks:
+    # send_messages accepts at most 10 entries
+    for i in range(0, len(jobs), 10):
         response = queue.send_messages(
                 Entries=[
-                    {'Id': '1', 'MessageBody': 'release-' + t},
-                    {'Id': '2', 'MessageBody': 'profiling-' + t}
+                    {'Id': str(n), 'MessageBody': j}
+                    for n, j in enumerate(jobs[i:i + 10])
                 ])
         assert(not response.get('Failed'))
 
     logger.info(region + ': SQS queue seeded with {} jobs'.format(
-        len(tasks) * 2))
+        len(jobs)))
 
 
 def run_perf_test(
@@ -583,23 +651,25 @@ def run_perf_test(
             Capabilities=['CAPABILITY_NAMED_IAM'])
 
     logger.info(region + ': Waiting for completition of ' + stack_name)
-    waiter = cfn.meta.client.get_waiter('stack_create_complete')
-    waiter.wait(StackName=stack_name)
+    stack = wait_for_stack(cfn, stack_name)
     asg_name = stack.outputs[0]['OutputValue']
     asg = session.client('autoscaling', region_name=region)
     # make sure hosts that have been shut down don't come back
     asg.suspend_processes(
             AutoScalingGroupName=asg_name,
             ScalingProcesses=['ReplaceUnhealthy'])
-    while True:
+
+    def populated():
+        # https://gist.github.com/alertedsnake/4b85ea44481f518cf157
         res = asg.describe_auto_scaling_instances()
-        if len(res['AutoScalingInstances']) == parallel:
-            break
+        instances = [a['InstanceId'] for a in res['AutoScalingInstances']
+                        if a['AutoScalingGroupName'] == asg_name]
+        if len(instances) == parallel:
+            return instances
         logger.info(region + ': Waiting for AutoScalingGroup to be populated')
-        time.sleep(10)
-    # https://gist.github.com/alertedsnake/4b85ea44481f518cf157
-    instances = [a['InstanceId'] for a in res['AutoScalingInstances']
-                    if a['AutoScalingGroupName'] == asg_name]
+        return None
+
+    instances = poll(populated)
 
     ec2 = session.client('ec2', region_name=region)
     for instance_id in instances:
@@ -608,6 +678,152 @@ def run_perf_test(
         logger.info(region + ': Running benchmarks on ' + name)
 
 
+class AwsBackend(object):
+    """
+    runs the stages of a performance test on AWS
+    """
+    def __init__(self, args, perf_test_id):
+        self.logger = logging.getLogger('perf_test')
+        self.args = args
+        self.perf_test_id = perf_test_id
+        self.session = boto3.session.Session()
+
+    def setup(self):
+        args = self.args
+        session = self.session
+
+        # pick the most suitable region
+        if args.price_fixture:
+            prices = FixturePriceSource(args.price_fixture)
+        else:
+            prices = AwsPriceSource()
+            if args.price_cache_ttl > 0:
+                prices = PriceCache(
+                        prices, args.price_cache, args.price_cache_ttl)
+        (self.region, self.az, self.price, self.ami) = select_region(
+                prices, args.mode, args.region, args.instance_type)
+
+        # fail early if key configuration would fail
+        if args.ssh_key_name:
+            ec2 = session.client('ec2', region_name=self.region)
+            res = ec2.describe_key_pairs(
+                    Filters=[
+                        {'Name': 'key-name', 'Values': [args.ssh_key_name]}
+                    ])
+            if not args.ssh_key:
+                assert(len(res['KeyPairs']) == 1)
+            elif len(res['KeyPairs']):
+                self.logger.warning(
+                        self.region + ': Key pair "' + args.ssh_key_name +
+                        '" already exists, ignoring key material')
+            else:
+                with open(args.ssh_key) as kf:
+                    pk = kf.read()
+                    ec2.import_key_pair(
+                            KeyName=args.ssh_key_name, PublicKeyMaterial=pk)
+
+        # target storage name
+        account_id = session.client('sts').get_caller_identity()['Account']
+        self.bucket_name = "perf-test-" + account_id
+
+    # the following stages run concurrently, hence each of them uses a
+    # session of its own
+
+    def prepare_store(self):
+        session = boto3.session.Session()
+        self.instance_terminated_arn = prepare_sns_s3(
+                session, self.args.email, self.bucket_name)
+        # hosts use this to split tasks into shards and merge their results
+        s3 = session.client('s3', region_name='us-east-1')
+        s3.upload_file(
+                same_dir('shards.py'), self.bucket_name,
+                self.perf_test_id + '/shards.py')
+
+    def prepare_workers(self):
+        self.snapshot_id = prepare_ebs(
+                boto3.session.Session(), self.region, self.az, self.ami)
+
+    def prepare_queue(self):
+        (self.queue, self.sqs_arn, self.sqs_url) = prepare_sqs(
+                boto3.session.Session(), self.region, self.perf_test_id)
+
+    def seed(self, jobs):
+        seed_queue(boto3.session.Session(), self.region, self.queue, jobs)
+
+    def runtimes(self):
+        """
+        (job, perf test id, seconds) records of the most recent performance
+        tests, as recorded by the fleet under runtimes/<job>/<perf test id>
+        in the bucket
+        """
+        s3 = self.session.client('s3', region_name='us-east-1')
+        keys = {}
+        try:
+            paginator = s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(
+                    Bucket=self.bucket_name, Prefix='runtimes/'):
+                for o in page.get('Contents', []):
+                    _, job, perf_test_id = o['Key'].split('/')
+                    cfg, task, _, _ = parse_job(job)
+                    keys.setdefault(cfg + '-' + task, []).append(
+                            (perf_test_id, job))
+        except s3.exceptions.NoSuchBucket:
+            return []
+
+        # perf test ids start with a timestamp, thus sort chronologically
+        wanted = []
+        for records in keys.values():
+            recent = sorted(set(i for i, _ in records))[-HISTORY_DEPTH:]
+            wanted += [(job, i) for i, job in records if i in recent]
+
+        def fetch(record):
+            key = 'runtimes/{}/{}'.format(*record)
+            body = s3.get_object(Bucket=self.bucket_name, Key=key)['Body']
+            return record + (int(body.read()),)
+
+        with concurrent.futures.ThreadPoolExecutor(16) as e:
+            return list(e.map(fetch, wanted))
+
+    def seal(self):
+        # workers shut down once they find the queue empty, which they must
+        # not do before all jobs have been seeded
+        s3 = boto3.session.Session().client('s3', region_name='us-east-1')
+        s3.put_object(
+                Bucket=self.bucket_name,
+                Key=self.perf_test_id + '/seeded',
+                Body=b'')
+        self.logger.info('us-east-1: All jobs seeded')
+
+    def build(self, configs, on_built):
+        # codebuild.yaml always builds both configurations
+        assert(set(configs) == set(CONFIGS))
+        build(boto3.session.Session(), self.args.repository,
+              self.args.commit_id, self.bucket_name, self.perf_test_id,
+              self.args.code_build, on_built)
+
+    def start_workers(self):
+        args = self.args
+        run_perf_test(
+                self.session, args.mode, self.region, self.az, self.ami,
+                args.instance_type, self.sqs_arn, self.sqs_url,
+                args.parallel, self.snapshot_id,
+                self.instance_terminated_arn, self.bucket_name,
+                self.perf_test_id, self.price, args.ssh_key_name,
+                args.witness_check)
+
+    def wait(self):
+        # the fleet reports results via SNS and shuts itself down
+        return 0
+
+
+def make_backend(args, perf_test_id):
+    if args.backend == 'aws':
+        return AwsBackend(args, perf_test_id)
+    else:
+        from local_backend import LocalBackend
+        return LocalBackend(args, perf_test_id)
+
+
 def main():
     logging_format = "%(asctime)-15s: %(message)s"
     logging.basicConfig(format=logging_format)
@@ -615,68 +831,84 @@ def main():
     logger.setLevel('DEBUG')
 
     args = parse_args()
-
-    # pick the most suitable region
-    session = boto3.session.Session()
-    (region, az, price, ami) = select_region(
-            session, args.mode, args.region, args.instance_type)
-
-    # fail early if key configuration would fail
-    if args.ssh_key_name:
-        ec2 = session.client('ec2', region_name=region)
-        res = ec2.describe_key_pairs(
-                Filters=[
-                    {'Name': 'key-name', 'Values': [args.ssh_key_name]}
-                ])
-        if not args.ssh_key:
-            assert(len(res['KeyPairs']) == 1)
-        elif len(res['KeyPairs']):
-            logger.warning(region + ': Key pair "' + args.ssh_key_name +
-                           '" already exists, ignoring key material')
-        else:
-            with open(args.ssh_key) as kf:
-                pk = kf.read()
-                ec2.import_key_pair(
-                        KeyName=args.ssh_key_name, PublicKeyMaterial=pk)
+    tasks = select_tasks(args.tasks)
 
     # build a unique id for this performance test run
     perf_test_id = str(datetime.datetime.utcnow().isoformat(
         sep='-', timespec='seconds')) + '-' + args.commit_id
     perf_test_id = re.sub('[:/_\.\^~ ]', '-', perf_test_id)
+
+    backend = make_backend(args, perf_test_id)
+    backend.setup()
     logger.info('global: Preparing performance test ' + perf_test_id)
 
-    # target storage name
-    account_id = session.client('sts').get_caller_identity()['Account']
-    bucket_name = "perf-test-" + account_id
-
-    # configuration set, let's create the infrastructure
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as e:
-        session1 = boto3.session.Session()
-        sns_s3_future = e.submit(
-                prepare_sns_s3, session1, args.email, bucket_name)
-        session2 = boto3.session.Session()
-        build_future = e.submit(
-                build, session2, args.repository, args.commit_id, bucket_name,
-                perf_test_id, args.code_build)
-        session3 = boto3.session.Session()
-        ebs_future = e.submit(prepare_ebs, session3, region, az, ami)
-        session4 = boto3.session.Session()
-        sqs_future = e.submit(
-                prepare_sqs, session4, region, perf_test_id, args.tasks)
-
-    # wait for all preparation steps to complete
-    instance_terminated_arn = sns_s3_future.result()
-    build_future.result()
-    snapshot_id = ebs_future.result()
-    (queue, sqs_arn, sqs_url) = sqs_future.result()
-
-    run_perf_test(
-            session, args.mode, region, az, ami, args.instance_type,
-            sqs_arn, sqs_url, args.parallel, snapshot_id,
-            instance_terminated_arn, bucket_name, perf_test_id, price,
-            args.ssh_key_name, args.witness_check)
-
-    return 0
+    # schedule long jobs first, size the fleet to fit, and split jobs that
+    # would take longer than a host's share of the work
+    estimates = estimate_runtimes(
+            make_jobs(tasks), runtime_history(backend.runtimes()))
+    if not args.parallel:
+        args.parallel = choose_fleet_size(
+                estimates.values(), args.max_parallel)
+    shards = plan_shards(estimates, args.parallel, args.max_shards)
+    shard_estimates = {}
+    for j, n in shards.items():
+        for i in range(1, n + 1):
+            shard_estimates[shard_job(j, i, n) if n > 1 else j] = \
+                estimates[j] / n
+    logger.info('global: Using {} hosts for {} jobs, '.format(
+        args.parallel, len(shard_estimates)) +
+        'estimated total runtime {}s'.format(
+            int(sum(shard_estimates.values()))))
+
+    # configuration set, let's create the infrastructure; each stage starts
+    # as soon as the stages it depends on have completed
+    e = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+    store_future = e.submit(backend.prepare_store)
+    workers_future = e.submit(backend.prepare_workers)
+    queue_future = e.submit(backend.prepare_queue)
+
+    built = {c: concurrent.futures.Future() for c in CONFIGS}
+
+    def build_done(f):
+        # a failed build fails all configurations not yet built
+        for b in built.values():
+            if f.exception() and not b.done():
+                b.set_exception(f.exception())
+
+    build_future = e.submit(
+            backend.build, CONFIGS, lambda c: built[c].set_result(c))
+    build_future.add_done_callback(build_done)
+
+    # each configuration's jobs are queued longest first once its build is
+    # done; across configurations, the order is that of the builds
+    seeded = {
+        c: when_done(e, [queue_future, built[c]], backend.seed,
+                     longest_first(
+                         [j for j in shard_estimates if parse_job(j)[0] == c],
+                         shard_estimates))
+        for c in CONFIGS
+    }
+
+    def seal():
+        # seal the queue even when seeding failed, as otherwise a fleet that
+        # is already running would wait for the missing jobs forever
+        concurrent.futures.wait(list(seeded.values()))
+        backend.seal()
+
+    sealed = e.submit(seal)
+
+    # the fleet need not wait for the profiling build, there are release
+    # jobs to work on already
+    started = when_done(
+            e, [store_future, workers_future, seeded['release']],
+            backend.start_workers)
+    finished = when_done(
+            e, [started, sealed, build_future], backend.wait)
+
+    try:
+        return finished.result()
+    finally:
+        e.shutdown()
 
 
 if __name__ == '__main__':
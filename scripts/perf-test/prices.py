@@ -0,0 +1,259 @@
+"""
+Look up EC2 instance prices for picking the cheapest region.
+
+Prices come from a price source: AwsPriceSource queries AWS, while
+FixturePriceSource reads them from a JSON file of the form
+
+    {
+        "regions": {
+            "us-east-1": {
+                "availability_zones": ["us-east-1a", "us-east-1b"],
+                "on-demand": {"r4.16xlarge": 4.256},
+                "spot": {"r4.16xlarge": [["us-east-1a", 0.64]]}
+            }
+        }
+    }
+
+so that region selection can be tried without AWS access. Prices fetched
+from AWS can be cached on disk by wrapping the source in a PriceCache.
+"""
+
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import urllib.request
+
+try:
+    import boto3
+except ImportError:
+    # only required for AwsPriceSource
+    boto3 = None
+
+
+PRICING_URL = ('https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/' +
+               'AmazonEC2/current/{}/index.json')
+
+WHITESPACE = re.compile(r'\s*')
+NUMBER_CHARS = re.compile(r'[0-9.eE+-]*')
+
+
+class JsonStream(object):
+    """
+    decode a large JSON document piecemeal while reading it from a text
+    stream, so that reading can stop as soon as the interesting part has
+    been seen
+    """
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        skip whitespace and return the next character ('' at the end)
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, c):
+        assert(self.peek() == c)
+        self.pos += 1
+
+    def value(self):
+        """
+        decode the next value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number running up to the end of the buffer may continue
+                # in the next chunk
+                if (self.eof or NUMBER_CHARS.match(self.buf, self.pos).end() <
+                        len(self.buf)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def members(self):
+        """
+        iterate over the keys of the next object; the caller has to consume
+        the value of each key, by calling value() or members(), before
+        advancing
+        """
+        self.expect('{')
+        first = True
+        while self.peek() != '}':
+            if not first:
+                self.expect(',')
+            key = self.value()
+            self.expect(':')
+            yield key
+            first = False
+        self.pos += 1
+
+
+def is_instance_offer(product, instance_type):
+    a = product.get('attributes', {})
+    return (product.get('productFamily') == 'Compute Instance' and
+            a.get('instanceType') == instance_type and
+            a.get('tenancy') == 'Shared' and
+            a.get('operatingSystem') == 'Linux')
+
+
+def find_on_demand_price(f, instance_type):
+    """
+    return the on-demand price of instance_type from a pricing index.json
+    read from text stream f; all products are listed before the terms, and
+    reading stops once the OnDemand term of the product has been found
+    """
+    doc = JsonStream(f)
+    sku = None
+    for key in doc.members():
+        if key == 'products':
+            for s in doc.members():
+                if is_instance_offer(doc.value(), instance_type):
+                    assert(not sku)
+                    sku = s
+        elif key == 'terms':
+            assert(sku)
+            for term_type in doc.members():
+                if term_type != 'OnDemand':
+                    doc.value()
+                    continue
+                for s in doc.members():
+                    terms = doc.value()
+                    if s != sku:
+                        continue
+                    for c in terms:
+                        v = terms[c]
+                        for p in v['priceDimensions']:
+                            price = v['priceDimensions'][p]['pricePerUnit']
+                    return float(price['USD'])
+        else:
+            doc.value()
+    assert(False)
+
+
+class AwsPriceSource(object):
+    """
+    prices as currently offered by AWS; each method creates its own boto3
+    session so that regions can be queried in parallel
+    """
+    def regions(self):
+        ec2 = boto3.session.Session().client('ec2')
+        return [r['RegionName'] for r in ec2.describe_regions()['Regions']]
+
+    def availability_zones(self, region):
+        ec2 = boto3.session.Session().client('ec2', region_name=region)
+        azs = ec2.describe_availability_zones(
+                Filters=[{'Name': 'region-name', 'Values': [region]}])
+        return [az['ZoneName'] for az in azs['AvailabilityZones']]
+
+    def on_demand_price(self, region, instance_type):
+        with urllib.request.urlopen(PRICING_URL.format(region)) as r:
+            return find_on_demand_price(
+                    io.TextIOWrapper(r, encoding='utf-8'), instance_type)
+
+    def spot_prices(self, region, instance_type):
+        """
+        return a list of (availability zone, price) pairs
+        """
+        ec2 = boto3.session.Session().client('ec2', region_name=region)
+        res = ec2.describe_spot_price_history(
+                InstanceTypes=[instance_type],
+                ProductDescriptions=['Linux/UNIX'],
+                StartTime=datetime.datetime.now())
+        return [(az['AvailabilityZone'], float(az['SpotPrice']))
+                for az in res['SpotPriceHistory']]
+
+
+class FixturePriceSource(object):
+    """
+    prices read from a JSON file, see the module documentation
+    """
+    def __init__(self, fixture_file):
+        with open(fixture_file) as f:
+            self.fixture = json.load(f)['regions']
+
+    def regions(self):
+        return list(self.fixture)
+
+    def availability_zones(self, region):
+        return self.fixture[region]['availability_zones']
+
+    def on_demand_price(self, region, instance_type):
+        return self.fixture[region]['on-demand'][instance_type]
+
+    def spot_prices(self, region, instance_type):
+        return [tuple(p) for p in
+                self.fixture[region]['spot'].get(instance_type, [])]
+
+
+class PriceCache(object):
+    """
+    keep prices returned by a price source on disk for ttl seconds
+    """
+    def __init__(self, source, cache_dir, ttl):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def cached(self, key, compute):
+        path = os.path.join(self.cache_dir, key + '.json')
+        try:
+            age = (datetime.datetime.now().timestamp() -
+                   os.path.getmtime(path))
+            if age < self.ttl:
+                with open(path) as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        result = compute()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+        return result
+
+    def regions(self):
+        return self.cached('regions', self.source.regions)
+
+    def availability_zones(self, region):
+        return self.cached(
+                'azs-' + region,
+                lambda: self.source.availability_zones(region))
+
+    def on_demand_price(self, region, instance_type):
+        return self.cached(
+                'on-demand-{}-{}'.format(region, instance_type),
+                lambda: self.source.on_demand_price(region, instance_type))
+
+    def spot_prices(self, region, instance_type):
+        return [tuple(p) for p in self.cached(
+                'spot-{}-{}'.format(region, instance_type),
+                lambda: self.source.spot_prices(region, instance_type))]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for looking up prices and selecting a region without AWS access. Run
+with
+
+    python3 -m unittest prices_test
+
+from the scripts/perf-test directory.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from perf_test import select_region
+from prices import FixturePriceSource, JsonStream, PriceCache, \
+    find_on_demand_price
+
+
+def offer(instance_type):
+    return {'productFamily': 'Compute Instance',
+            'attributes': {'instanceType': instance_type,
+                           'tenancy': 'Shared',
+                           'operatingSystem': 'Linux'}}
+
+
+def on_demand_term(sku, usd):
+    return {sku + '.TERM': {'priceDimensions': {sku + '.TERM.DIM': {
+        'pricePerUnit': {'USD': usd}}}}}
+
+
+INDEX = json.dumps({
+    'formatVersion': 'v1.0',
+    'products': {
+        'SKU1': offer('m5.large'),
+        'SKU2': offer('r4.16xlarge'),
+    },
+    'terms': {
+        'Reserved': {'SKU2': on_demand_term('SKU2', '2.5')},
+        'OnDemand': {
+            'SKU1': on_demand_term('SKU1', '0.096'),
+            'SKU2': on_demand_term('SKU2', '4.2560000000'),
+        },
+    },
+}, indent=1)
+
+FIXTURE = {
+    'regions': {
+        'us-east-1': {
+            'availability_zones': ['us-east-1a', 'us-east-1b'],
+            'on-demand': {'r4.16xlarge': 4.256},
+            'spot': {'r4.16xlarge': [['us-east-1a', 0.9],
+                                     ['us-east-1b', 0.7]]},
+        },
+        'eu-west-1': {
+            'availability_zones': ['eu-west-1c'],
+            'on-demand': {'r4.16xlarge': 4.744},
+            'spot': {'r4.16xlarge': [['eu-west-1c', 0.64]]},
+        },
+    }
+}
+
+
+class JsonStreamTest(unittest.TestCase):
+    DOCUMENTS = [
+        '{"a": 12345.678, "b": [1e10, -3, 0.5E-2], "c": "x\\"y"}',
+        '[123456789, {"nested": {"deep": [true, false, null]}}, -0.25]',
+        '  {"pi": 3.14159265358979, "big": 12345678901234567890}  ',
+        '98765.4321',
+    ]
+
+    def test_value_matches_json_loads(self):
+        # small chunks split numbers, strings and keywords between reads
+        for doc in self.DOCUMENTS:
+            for chunk_size in [1, 2, 3, 5, 7, 64]:
+                stream = JsonStream(io.StringIO(doc), chunk_size)
+                self.assertEqual(stream.value(), json.loads(doc),
+                                 (doc, chunk_size))
+
+    def test_members(self):
+        doc = '{"x": 1, "skipped": {"y": [2, 3]}, "z": 456789}'
+        for chunk_size in [1, 4, 64]:
+            stream = JsonStream(io.StringIO(doc), chunk_size)
+            values = {}
+            for key in stream.members():
+                values[key] = stream.value()
+            self.assertEqual(values, json.loads(doc))
+
+
+class ShortReads(io.StringIO):
+    """ a text stream returning at most chunk_size characters per read """
+    def __init__(self, text, chunk_size):
+        super().__init__(text)
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        return super().read(size)
+
+
+class FindOnDemandPriceTest(unittest.TestCase):
+    def test_minimal_index(self):
+        for chunk_size in [3, 1 << 20]:
+            f = ShortReads(INDEX, chunk_size)
+            self.assertEqual(find_on_demand_price(f, 'r4.16xlarge'), 4.256)
+
+    def test_stops_reading_after_the_price(self):
+        # anything after the term of the product is never decoded
+        doc = INDEX[:INDEX.rindex('}')] + ', "garbage": ]]]}'
+        self.assertEqual(
+            find_on_demand_price(io.StringIO(doc), 'm5.large'), 0.096)
+
+
+class SelectRegionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fixture = os.path.join(self.dir, 'prices.json')
+        with open(self.fixture, 'w') as f:
+            json.dump(FIXTURE, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_spot(self):
+        region, az, price, ami = select_region(
+            FixturePriceSource(self.fixture), 'spot', None, 'r4.16xlarge')
+        self.assertEqual((region, az, price), ('eu-west-1', 'eu-west-1c',
+                                               0.64))
+        self.assertTrue(ami.startswith('ami-'))
+
+    def test_on_demand(self):
+        region, az, price, _ = select_region(
+            FixturePriceSource(self.fixture), 'on-demand', None,
+            'r4.16xlarge')
+        self.assertEqual((region, az, price), ('us-east-1', 'us-east-1a',
+                                               4.256))
+
+    def test_given_region(self):
+        region, az, price, _ = select_region(
+            FixturePriceSource(self.fixture), 'spot', 'us-east-1',
+            'r4.16xlarge')
+        self.assertEqual((region, az, price), ('us-east-1', 'us-east-1b',
+                                               0.7))
+
+    def test_cache(self):
+        class CountingSource(FixturePriceSource):
+            calls = 0
+
+            def spot_prices(self, region, instance_type):
+                CountingSource.calls += 1
+                return FixturePriceSource.spot_prices(
+                    self, region, instance_type)
+
+        cache_dir = os.path.join(self.dir, 'cache')
+        prices = PriceCache(CountingSource(self.fixture), cache_dir, 3600)
+        first = select_region(prices, 'spot', None, 'r4.16xlarge')
+        self.assertEqual(CountingSource.calls, 2)
+        self.assertEqual(select_region(prices, 'spot', None, 'r4.16xlarge'),
+                         first)
+        self.assertEqual(CountingSource.calls, 2)
+
+        # once the entries are older than the ttl, they are fetched again
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            old = os.path.getmtime(path) - 3601
+            os.utime(path, (old, old))
+        self.assertEqual(select_region(prices, 'spot', None, 'r4.16xlarge'),
+                         first)
+        self.assertEqual(CountingSource.calls, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
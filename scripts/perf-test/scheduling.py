@@ -0,0 +1,103 @@
+"""
+Order jobs and size the fleet using runtimes of previous performance tests.
+
+Each host works on one job at a time and takes the next one from the queue
+when done, i.e., jobs are assigned greedily in queue order. The jobs of
+each configuration are seeded longest first, which keeps long categories
+from being left until the end. This is only best effort: each
+configuration is seeded as soon as its build is done, so all release jobs
+are queued before the profiling ones, and SQS standard queues do not
+guarantee first-in first-out order anyway. Categories that would still
+take longer than the fleet needs for everything else are split into
+shards.
+"""
+
+import heapq
+import math
+
+from benchmark_tasks import parse_job
+
+
+# assumed runtime of jobs that have never been run before, in seconds
+DEFAULT_RUNTIME = 3600
+
+# number of most recent runs that a job's estimate is based on
+HISTORY_DEPTH = 3
+
+
+def runtime_history(records):
+    """
+    map jobs to their runtimes in previous performance tests, oldest first,
+    given (job, perf test id, seconds) records; the runtimes of the shards
+    of a job are summed up
+    """
+    per_test = {}
+    for job, perf_test_id, seconds in records:
+        cfg, task, _, _ = parse_job(job)
+        key = (perf_test_id, cfg + '-' + task)
+        per_test[key] = per_test.get(key, 0) + seconds
+    history = {}
+    # perf test ids start with a timestamp, thus sort chronologically
+    for (_, job), seconds in sorted(per_test.items()):
+        history.setdefault(job, []).append(seconds)
+    return history
+
+
+def estimate_runtimes(jobs, history):
+    """
+    map each job to its estimated runtime, the mean of its most recent
+    runtimes; history maps jobs to lists of runtimes, oldest first. Jobs
+    without history are assumed to be as long as the longest known job, so
+    that they are started early.
+    """
+    known = {}
+    for j in jobs:
+        runtimes = history.get(j, [])[-HISTORY_DEPTH:]
+        if runtimes:
+            known[j] = sum(runtimes) / len(runtimes)
+    default = max(known.values()) if known else DEFAULT_RUNTIME
+    return {j: known.get(j, default) for j in jobs}
+
+
+def longest_first(jobs, estimates):
+    # stable, so jobs of equal estimate stay in their original order
+    return sorted(jobs, key=lambda j: -estimates[j])
+
+
+def makespan(runtimes, hosts):
+    """
+    completion time of the greedy schedule of runtimes, in queue order, on
+    the given number of hosts
+    """
+    busy_until = [0] * hosts
+    for r in runtimes:
+        heapq.heappush(busy_until, heapq.heappop(busy_until) + r)
+    return max(busy_until)
+
+
+def choose_fleet_size(runtimes, max_hosts, slack=1.1):
+    """
+    the smallest fleet whose makespan, were all jobs run longest first, is
+    within slack of the best possible one (the longest job); more hosts
+    would only add idle instance hours. This is an estimate for sizing the
+    fleet, not a prediction of the actual order (see above).
+    """
+    runtimes = sorted(runtimes, reverse=True)
+    limit = min(max_hosts, len(runtimes))
+    best = makespan(runtimes, limit)
+    for hosts in range(1, limit + 1):
+        if makespan(runtimes, hosts) <= max(best, runtimes[0]) * slack:
+            return hosts
+    return limit
+
+
+def plan_shards(estimates, hosts, max_shards):
+    """
+    number of shards per job, chosen such that no shard takes longer than
+    a host's share of the total runtime, if possible
+    """
+    share = sum(estimates.values()) / hosts
+    if not share:
+        return {j: 1 for j in estimates}
+    return {j: max(1, min(max_shards, int(math.ceil(e / share))))
+            for j, e in estimates.items()}
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Split SV-COMP categories into shards, and merge the results of the shards.
+
+A job for shard i of n of a category only runs every n-th verification task
+of the category, starting with the i-th one (counting from 1). Once all
+shards are done, their benchexec results are merged into a single result
+per category, as if the category had been run as a whole.
+
+This runs on the benchmarking hosts as well, hence it must not depend on
+anything beyond the Python 3.5 standard library.
+"""
+
+import argparse
+import bz2
+import glob
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+
+def set_file_patterns(set_file):
+    patterns = []
+    with open(set_file) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(
+                        os.path.join(os.path.dirname(set_file), line))
+    return patterns
+
+
+def expand(elements, base_dir):
+    """
+    the files named by include/includesfile or exclude/excludesfile
+    elements of a tasks element
+    """
+    files = set()
+    for e in elements:
+        path = os.path.join(base_dir, e.text.strip())
+        if e.tag.endswith('sfile'):
+            patterns = set_file_patterns(path)
+        else:
+            patterns = [path]
+        for p in patterns:
+            files.update(os.path.normpath(f) for f in glob.glob(p))
+    return files
+
+
+def split_tasks(benchmark_def, task, shard, shards):
+    """
+    restrict the tasks element named task in benchmark_def to the shard;
+    returns the number of verification tasks in the shard
+    """
+    base_dir = os.path.dirname(os.path.abspath(benchmark_def))
+    tree = ET.parse(benchmark_def)
+    count = 0
+    for tasks in tree.iter('tasks'):
+        if tasks.get('name') != task:
+            continue
+        includes = [e for e in tasks
+                    if e.tag in ['include', 'includesfile']]
+        excludes = [e for e in tasks
+                    if e.tag in ['exclude', 'excludesfile']]
+        files = sorted(expand(includes, base_dir) -
+                       expand(excludes, base_dir))[shard - 1::shards]
+        count += len(files)
+
+        set_file = os.path.join(
+                base_dir, '{}.{}of{}.set'.format(task, shard, shards))
+        with open(set_file, 'w') as f:
+            for name in files:
+                f.write(name + '\n')
+        for e in includes + excludes:
+            tasks.remove(e)
+        e = ET.Element('includesfile')
+        e.text = set_file
+        e.tail = '\n'
+        tasks.insert(0, e)
+
+    tree.write(benchmark_def)
+    return count
+
+
+def result_key(name):
+    # cbmc.<date>.results.<run definition>.<tasks>.xml.bz2: the date differs
+    # between shards
+    return name.split('.results.', 1)[-1]
+
+
+def merge_results(result_files, merged_file):
+    """
+    merge the benchexec results of all shards into one; the cputime totals
+    of the run sets are summed up and the walltime is the longest one, as
+    shards run in parallel, while other columns are those of the first shard
+    """
+    merged = None
+    totals = {}
+    for result_file in result_files:
+        with bz2.open(result_file, 'rt') as f:
+            root = ET.fromstring(f.read())
+        if merged is None:
+            merged = root
+        for c in root.findall('column'):
+            title = c.get('title')
+            if title not in ['cputime', 'walltime']:
+                continue
+            v = float(re.sub('s$', '', c.get('value')))
+            if title == 'walltime':
+                totals[title] = max(totals.get(title, 0), v)
+            else:
+                totals[title] = totals.get(title, 0) + v
+        if root is not merged:
+            for run in root.findall('run'):
+                merged.append(run)
+
+    for c in merged.findall('column'):
+        if c.get('title') in totals:
+            c.set('value', '{}s'.format(totals[c.get('title')]))
+
+    with bz2.open(merged_file, 'wb') as f:
+        f.write(ET.tostring(merged, encoding='utf-8'))
+
+
+def merge_shard_logs(shard_dirs, logs_dir):
+    """
+    merge the result files found in the shards' log directories into
+    logs_dir, keeping the name of the first shard's result
+    """
+    results = {}
+    for d in sorted(shard_dirs):
+        for r in sorted(glob.glob(os.path.join(d, '*.xml.bz2'))):
+            results.setdefault(result_key(os.path.basename(r)), []).append(r)
+    if not os.path.isdir(logs_dir):
+        os.makedirs(logs_dir)
+    for files in results.values():
+        merge_results(
+                files, os.path.join(logs_dir, os.path.basename(files[0])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='command')
+    s = sub.add_parser('split', help='restrict a benchmark definition')
+    s.add_argument('benchmark_def')
+    s.add_argument('task')
+    s.add_argument('shard', type=int)
+    s.add_argument('shards', type=int)
+    m = sub.add_parser('merge', help='merge the results of all shards')
+    m.add_argument('logs_dir')
+    m.add_argument('shard_dirs', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        assert(1 <= args.shard <= args.shards)
+        print(split_tasks(
+            args.benchmark_def, args.task, args.shard, args.shards))
+    elif args.command == 'merge':
+        merge_shard_logs(args.shard_dirs, args.logs_dir)
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for merging the results of shards. Run with
+
+    python3 -m unittest shards_test
+
+from the scripts/perf-test directory.
+"""
+
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from shards import merge_results
+
+
+SHARD = """<?xml version="1.0"?>
+<result tool="CBMC" name="cbmc.ReachSafety-Arrays">
+  <run name="{task}"><column title="status" value="true"/></run>
+  <column title="cputime" value="{cputime}s"/>
+  <column title="walltime" value="{walltime}s"/>
+  <column title="memory" value="{memory}B"/>
+</result>
+"""
+
+
+class MergeResultsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_shard(self, name, **values):
+        path = os.path.join(self.dir, name)
+        with bz2.open(path, 'wt') as f:
+            f.write(SHARD.format(**values))
+        return path
+
+    def test_two_shards(self):
+        shards = [
+            self.write_shard('1.xml.bz2', task='a.c', cputime=10.5,
+                             walltime=6.0, memory=1000),
+            self.write_shard('2.xml.bz2', task='b.c', cputime=2.0,
+                             walltime=8.0, memory=3000),
+        ]
+        merged_file = os.path.join(self.dir, 'merged.xml.bz2')
+        merge_results(shards, merged_file)
+
+        with bz2.open(merged_file, 'rt') as f:
+            merged = ET.fromstring(f.read())
+        self.assertEqual([r.get('name') for r in merged.findall('run')],
+                         ['a.c', 'b.c'])
+        columns = {c.get('title'): c.get('value')
+                   for c in merged.findall('column')}
+        self.assertEqual(columns, {'cputime': '12.5s', 'walltime': '8.0s',
+                                   'memory': '1000B'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
-import re, collections, textwrap, sys, argparse, platform
+import re, collections, textwrap, sys, argparse, platform, os, shutil, \
+        tempfile, io
 
 Field = collections.namedtuple('Field', ['name', 'contents'])
 
@@ -9,6 +10,9 @@ Function = collections.namedtuple('Function',
 
 Class = collections.namedtuple('Class', ['name', 'purpose'])
 
+Conversion = collections.namedtuple('Conversion',
+        ['file', 'blocks', 'warnings', 'changed'])
+
 
 def warn(message):
     """ Print a labelled message to stderr.  """
@@ -37,19 +41,74 @@ def class_from_block(block):
             block.fields.get('Purpose', None))
 
 
+FIELD_NAME_CHARS = frozenset(
+        'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+
+
 def parse_fields(block_contents):
-    """ Extract the named fields of an old-style comment block.  """
+    """
+    Extract the named fields of an old-style comment block.
 
-    field_re = re.compile(
-            r'(?:\n *(Purpose):(.*))|(?:\n *([a-zA-Z0-9]+?):\n?(.*?)?^$)',
-            re.MULTILINE | re.DOTALL)
-    for m in field_re.finditer(block_contents):
-        # If the field is a Purpose field
-        if m.lastindex == 2:
-            yield make_field(m.group(1), textwrap.dedent(m.group(2)))
-        # If the field is any other field
-        elif m.lastindex == 3 or m.lastindex == 4:
-            yield make_field(m.group(3), textwrap.dedent(m.group(4)))
+    A field starts on a line of the form '  Name:'. A Purpose field runs
+    to the end of the block; any other field runs up to the next empty
+    line, and is dropped if there is no empty line after it. This is a
+    single pass over the block, so long blocks without empty lines cannot
+    make it slow.
+    """
+    text = block_contents
+    length = len(text)
+
+    # The last search for an empty line: where it started and what it
+    # found. Searches only ever move forwards, so a later search that
+    # starts between the two can reuse the result.
+    searched_from = length + 1
+    empty_line = None
+
+    pos = text.find('\n')
+    while pos != -1:
+        start = pos + 1
+        while start < length and text[start] == ' ':
+            start += 1
+        end = start
+        while end < length and text[end] in FIELD_NAME_CHARS:
+            end += 1
+
+        if end > start and end < length and text[end] == ':':
+            name = text[start:end]
+            contents_start = end + 1
+            if name == 'Purpose':
+                yield make_field(name,
+                        textwrap.dedent(text[contents_start:]))
+                return
+            if text.startswith('\n', contents_start):
+                contents_start += 1
+
+            if not (searched_from <= contents_start and
+                    (empty_line is None or contents_start <= empty_line)):
+                searched_from = contents_start
+                empty_line = find_empty_line(text, contents_start)
+            if empty_line is not None:
+                yield make_field(name,
+                        textwrap.dedent(text[contents_start:empty_line]))
+                pos = text.find('\n', empty_line)
+                continue
+
+        pos = text.find('\n', pos + 1)
+
+
+def find_empty_line(text, pos):
+    """
+    Return the first position at or after pos which is both the start and
+    the end of a line, or None if there is none.
+    """
+    if pos > 0 and text[pos - 1] == '\n' and text.startswith('\n', pos):
+        return pos
+    found = text.find('\n\n', pos)
+    if found != -1:
+        return found + 1
+    if text.endswith('\n') and len(text) >= pos:
+        return len(text)
+    return None
 
 
 Block = collections.namedtuple('Block', ['fields'])
@@ -60,9 +119,13 @@ def has_field(block, field_name):
     return field_name in block.fields
 
 
+NON_EMPTY_LINE_RE = re.compile(r'^(?!$)', re.MULTILINE)
+EMPTY_LINE_RE = re.compile(r'^(?=$)', re.MULTILINE)
+
+
 def make_doxy_comment(text):
-    text = re.sub(r'^(?!$)', r'/// ', text, flags=re.MULTILINE)
-    return re.sub(r'^(?=$)', r'///' , text, flags=re.MULTILINE)
+    text = NON_EMPTY_LINE_RE.sub(r'/// ', text)
+    return EMPTY_LINE_RE.sub(r'///' , text)
 
 
 class GenericFormatter(object):
@@ -73,13 +136,17 @@ class GenericFormatter(object):
         self.whitespace_re = re.compile(r'\n\s*', re.MULTILINE | re.DOTALL)
 
     def convert(self, block):
-        sections = filter(None, self.convert_sections(block))
+        sections = [s for s in self.convert_sections(block) if s]
         if sections:
             return make_doxy_comment('\n'.join(sections)) + '\n'
         return ''
 
 
 class HeaderFormatter(GenericFormatter):
+    def __init__(self, doc_width):
+        super(HeaderFormatter, self).__init__(doc_width)
+        self.file_directive_re = re.compile(r'^\/\/\/ \\file$', re.MULTILINE)
+
     def format_module(self, header):
         if not header.module:
             return None
@@ -96,14 +163,16 @@ class HeaderFormatter(GenericFormatter):
         return [self.format_module(block)]
 
     def needs_new_header(self, file_contents):
-        return (re.search(r'^\/\/\/ \\file$', file_contents, flags=re.MULTILINE)
-                is None)
+        return self.file_directive_re.search(file_contents) is None
 
 
 class FunctionFormatter(GenericFormatter):
     def __init__(self, doc_width):
         super(FunctionFormatter, self).__init__(doc_width)
         self.paragraph_re = re.compile(r'(.*?)^$(.*)', re.MULTILINE | re.DOTALL)
+        self.single_word_re = re.compile(r'^\s*\S+\s*$')
+        self.continuation_re = re.compile(r'\n\s+', re.MULTILINE)
+        self.param_re = re.compile(r'^([a-zA-Z0-9_]+)\s*[:-]', re.MULTILINE)
 
     def format_purpose(self, function):
         if not function.purpose:
@@ -124,7 +193,7 @@ class FunctionFormatter(GenericFormatter):
         if not function.inputs:
             return None
 
-        if re.match(r'^\s*\S+\s*$', function.inputs):
+        if self.single_word_re.match(function.inputs):
             return None
 
         def param_replacement(match):
@@ -135,9 +204,8 @@ class FunctionFormatter(GenericFormatter):
 
         dedented = lines[0] + '\n' + textwrap.dedent(tail)
 
-        text = re.sub(r'\n\s+', ' ', dedented, flags=re.MULTILINE)
-        text, num_replacements = re.subn(r'^([a-zA-Z0-9_]+)\s*[:-]',
-                param_replacement, text, flags=re.MULTILINE)
+        text = self.continuation_re.sub(' ', dedented)
+        text, num_replacements = self.param_re.subn(param_replacement, text)
 
         if num_replacements == 0:
             text = r'\par parameters: %s' % text
@@ -196,7 +264,8 @@ def replace_block(
         file,
         header_formatter,
         class_formatter,
-        function_formatter):
+        function_formatter,
+        warnings):
     """
     Replace an old-style documentation block with the doxygen equivalent
     """
@@ -215,52 +284,127 @@ def replace_block(
     if function_formatter.is_block_valid(block):
         return function_formatter.convert(function_from_block(block))
 
-    warn('block in "%s" has unrecognised format:\n%s' %
+    warnings.append('block in "%s" has unrecognised format:\n%s' %
             (file, block_contents.group(1)))
 
     return ''
 
 
-def convert_file(file, inplace):
-    """ Replace documentation in file with doxygen-styled comments.  """
-    with open(file) as f:
-        contents = f.read()
+def write_atomically(file, contents):
+    """ Replace the contents of file without ever leaving it half-written.  """
+    directory, name = os.path.split(file)
+    fd, tmp = tempfile.mkstemp(prefix=name + '.', dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(contents)
+        shutil.copymode(file, tmp)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
-    doc_width = 76
 
-    header_formatter = HeaderFormatter(doc_width)
-    class_formatter = ClassFormatter(doc_width)
-    function_formatter = FunctionFormatter(doc_width)
+# Every old-style block starts with a line ending in this.
+BLOCK_MARKER = '*\\'
 
-    block_re = re.compile(
-            r'^/\*+\\$(.*?)^\\\*+/$\s*', re.MULTILINE | re.DOTALL)
-    new_contents = block_re.sub(
-            lambda match: replace_block(
-                match,
-                contents,
-                file,
-                header_formatter,
-                class_formatter,
-                function_formatter), contents)
 
-    if inplace:
-        with open(file, 'w') as f:
-            f.write(new_contents)
-    else:
-        sys.stdout.write(new_contents)
+class DocConverter(object):
+    """
+    Converts the old-style documentation blocks of whole files.
+
+    The formatters and regular expressions are built once, so one converter
+    should be reused for all the files in a run.
+    """
+    def __init__(self, doc_width=76):
+        self.header_formatter = HeaderFormatter(doc_width)
+        self.class_formatter = ClassFormatter(doc_width)
+        self.function_formatter = FunctionFormatter(doc_width)
+        self.block_re = re.compile(
+                r'^/\*+\\$(.*?)^\\\*+/$\s*', re.MULTILINE | re.DOTALL)
+
+    def convert(self, contents, file):
+        """
+        Return the converted contents of file, and a Conversion recording
+        how many blocks were converted and the warnings raised for blocks
+        that could not be.
+        """
+        warnings = []
+        if BLOCK_MARKER not in contents:
+            return contents, Conversion(file, 0, warnings, False)
+        new_contents, num_blocks = self.block_re.subn(
+                lambda match: replace_block(
+                    match,
+                    contents,
+                    file,
+                    self.header_formatter,
+                    self.class_formatter,
+                    self.function_formatter,
+                    warnings), contents)
+        return new_contents, Conversion(file, num_blocks - len(warnings),
+                warnings, new_contents != contents)
+
+    def convert_file(self, file, inplace, quiet=False, check=False):
+        """
+        Replace documentation in file with doxygen-styled comments.
+
+        Returns the Conversion for the file; unless quiet is set, its
+        warnings are also printed. Files are only rewritten if their
+        contents change. If check is set, nothing is written.
+        """
+        with open(file, 'rb') as f:
+            raw = f.read()
+
+        # Most files have no old-style blocks left; don't bother decoding
+        # them unless we have to print them.
+        if BLOCK_MARKER.encode() not in raw and (inplace or check):
+            return Conversion(file, 0, [], False)
+
+        contents = io.TextIOWrapper(io.BytesIO(raw)).read()
+        new_contents, conversion = self.convert(contents, file)
+
+        if not quiet:
+            for message in conversion.warnings:
+                warn(message)
+
+        if check:
+            pass
+        elif inplace:
+            if conversion.changed:
+                write_atomically(file, new_contents)
+        else:
+            sys.stdout.write(new_contents)
+
+        return conversion
+
+
+default_converter = DocConverter()
+
+
+def convert_file(file, inplace, quiet=False, check=False):
+    """ Replace documentation in file with doxygen-styled comments.  """
+    return default_converter.convert_file(file, inplace, quiet, check)
 
 
 def main():
     """ Run convert_file from the command-line.  """
     parser = argparse.ArgumentParser()
-    parser.add_argument('file', type=str, help='The file to process')
+    parser.add_argument('files', metavar='file', type=str, nargs='+',
+            help='The files to process')
     parser.add_argument('-i', '--inplace', action='store_true',
             help='Process in place')
+    parser.add_argument('--check', action='store_true',
+            help='List the files that would be changed, without changing '
+                 'them; exit with status 1 if there are any')
     args = parser.parse_args()
 
-    convert_file(args.file, args.inplace)
+    changed = False
+    for file in args.files:
+        conversion = convert_file(file, args.inplace, check=args.check)
+        if args.check and conversion.changed:
+            print(file)
+            changed = True
 
-    return 0
+    return 1 if changed else 0
 
 
 if __name__ == '__main__':
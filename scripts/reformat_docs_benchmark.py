@@ -0,0 +1,70 @@
+"""
+Measure how long reformat_docs takes per documentation block.
+
+Run this from CBMC's top-level directory. The files are read into memory
+up front and nothing is written, so only the conversion itself is timed.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+from reformat_docs import DocConverter
+
+
+def read_sources(dirs):
+    """ Return (path, contents) for every .h and .cpp file under dirs.  """
+    match_re = re.compile(r'.*\.(h|cpp)$')
+    sources = []
+    for top in dirs:
+        for root, _, files in os.walk(top):
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                if match_re.match(path):
+                    with open(path) as f:
+                        sources.append((path, f.read()))
+    return sources
+
+
+def run(sources, make_converter):
+    """
+    Convert all sources, calling make_converter to get the converter for
+    each file. Return the elapsed time and the number of blocks seen.
+    """
+    blocks = 0
+    start = time.perf_counter()
+    for path, contents in sources:
+        _, conversion = make_converter().convert(contents, path)
+        blocks += conversion.blocks + len(conversion.warnings)
+    return time.perf_counter() - start, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dirs', nargs='*', default=['src'],
+            help='Directories to convert (default: src)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+            help='Number of runs of each mode; the fastest is reported')
+    args = parser.parse_args()
+
+    sources = read_sources(args.dirs)
+    shared = DocConverter()
+    modes = [
+        ('converter per file', DocConverter),
+        ('shared converter', lambda: shared)]
+
+    print('%d files' % len(sources))
+    for name, make_converter in modes:
+        elapsed, blocks = min(run(sources, make_converter)
+                for _ in range(args.repeat))
+        per_block = elapsed / blocks * 1e6 if blocks else 0.0
+        print('%-20s %8.3f s  %6d blocks  %8.1f us/block' %
+                (name, elapsed, blocks, per_block))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Check that every irep id declared in src/util/irep_ids.def is used.
+
+Run this from CBMC's top-level directory. The ids are obtained by expanding
+irep_ids.def with the preprocessor, as irep_ids.h does. An id counts as used
+if its ID_ name occurs as a whole word in any file tracked by git, which is
+what `git grep -w -F ID_name` finds. Rather than grepping once per id, the
+tracked files are tokenized once, in parallel, into a count of the ID_
+identifiers they contain, and all unused ids are reported together.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+
+
+IDS_FILE = 'src/util/irep_ids.def'
+
+# Ids that are not used in this repository but are kept on purpose.
+WHITELIST = [
+]
+
+# Identifiers that may be an irep id; git grep -w takes letters, digits and
+# underscores as word characters, which is what \w matches in a bytes regex.
+ID_RE = re.compile(br'\bID_\w+')
+
+
+def read_ids(ids_file):
+    """ Return the ID_ names declared in ids_file, in order.  """
+    out = subprocess.check_output(
+        ['gcc', '-E', '-P', '-x', 'c', ids_file,
+         '-DIREP_ID_ONE(x)=ID_ ## x', '-DIREP_ID_TWO(x,y)=ID_ ## x'])
+    return [i for i in out.decode('utf-8').split() if i not in WHITELIST]
+
+
+def tracked_files():
+    """ Return the paths of the regular files tracked by git.  """
+    out = subprocess.check_output(['git', 'ls-files', '-z'])
+    paths = [p for p in out.decode('utf-8').split('\0') if p]
+    # Skips submodules and files deleted from the working tree, which git
+    # grep does not search either.
+    return [p for p in paths if os.path.isfile(p) and not os.path.islink(p)]
+
+
+def count_ids(paths):
+    """ Return how often each ID_ identifier occurs in the files.  """
+    counts = collections.Counter()
+    for path in paths:
+        with open(path, 'rb') as f:
+            counts.update(ID_RE.findall(f.read()))
+    return counts
+
+
+def index_ids(paths, jobs):
+    """ Count the ID_ identifiers in all files, using jobs processes.  """
+    shards = [paths[i::jobs * 4] for i in range(jobs * 4)]
+    counts = collections.Counter()
+    if jobs == 1:
+        for shard in shards:
+            counts.update(count_ids(shard))
+        return counts
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for shard_counts in pool.imap_unordered(count_ids, shards):
+            counts.update(shard_counts)
+    finally:
+        pool.close()
+        pool.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int,
+            default=multiprocessing.cpu_count(),
+            help='Number of processes to read files with '
+                 '(default: one per CPU)')
+    args = parser.parse_args()
+
+    ids = read_ids(IDS_FILE)
+    counts = index_ids(tracked_files(), max(1, args.jobs))
+    unused = [i for i in ids if counts[i.encode('utf-8')] == 0]
+    for i in unused:
+        print('%s is never used' % i)
+    return 1 if unused else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())